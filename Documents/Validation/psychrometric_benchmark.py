@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+空気状態関数の精度と計算速度のベンチマーク
+
+phyvacの空気状態関数（スカラー版と配列版）について、1回あたりの計算時間と、
+参照式・参照値に対する誤差を求め、JSON形式のレポートとして出力する。
+
+参照とする計算式
+- 飽和水蒸気圧（水）: IAPWS-95の補助式（Wagner and Pruss, 2002）
+- 飽和水蒸気圧（氷）: IAPWS 2011の昇華圧の式（Wagner et al., 2011）
+- 絶対湿度、比エンタルピー、湿球温度、空気密度: ASHRAE Handbook Fundamentals 2017, Chapter 1
+  （大気圧101.325kPa、0℃未満は氷に対する飽和とする）
+
+使い方（リポジトリのルートで実行）。JSONレポートは標準出力（--outputでファイル）、結果の一覧は標準エラー出力に出力する
+    python Documents/Validation/psychrometric_benchmark.py > psychrometric_benchmark.json
+    python Documents/Validation/psychrometric_benchmark.py --tol tdb=0.05 --backend table --output report.json
+
+合否判定基準（TOLERANCE）は、25℃付近で乾球温度0.1℃、相対湿度1%の精度に相当する値とする。
+各関数は対象とする範囲（SUPPORTED_RANGE）の格子点のみで評価し、計算式そのものの誤差が基準を超えることが
+分かっている関数（NOT_GATED）は誤差を出力するのみとする。
+それ以外の全関数の誤差と飽和水蒸気圧の参照値（PSAT_REFERENCE_TABLE）との相対誤差がすべて基準内の場合は
+終了コード0、一つでも超える場合は終了コード1を返すので、飽和水蒸気圧の計算方法（--backend）ごとに実行すれば、
+基準を満たす中で最も速い計算方法を機械的に選べる。--tolによる上書きは感度の確認用。
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+with contextlib.redirect_stdout(sys.stderr):  # 読み込み時の表示がJSONレポートに混ざらないようにする
+    import phyvac as pv  # noqa: E402
+
+P_ATM = 101.325  # 大気圧[kPa]
+
+# 計算範囲（空調設計で扱う範囲）
+TDB_MIN = -20.0
+TDB_MAX = 50.0
+RH_MIN = 5.0
+RH_MAX = 100.0
+
+# 合否判定基準（絶対誤差）。単位は各関数の出力の単位
+# 温度0.1℃、25℃での相対湿度1%（絶対湿度0.0002kg/kg'、比エンタルピー0.5kJ/kg'）に相当する値
+TOLERANCE = {
+    'psat': 0.005,  # [kPa] 25℃の飽和水蒸気圧の約0.16%
+    'tdb': 0.1,  # ['C]
+    'w': 0.0002,  # [kg/kg']
+    'h': 0.5,  # [kJ/kg']
+    'rh': 1.0,  # [%]
+    'den': 0.01,  # [kg/m3] 約0.8%
+    'psat_table': 0.001,  # [-] 飽和水蒸気圧の参照値（PSAT_REFERENCE_TABLE）に対する相対誤差
+}
+# 参照式と参照値（有効数字6桁）の相対誤差の上限[-]（参照式の実装の確認）
+PSAT_REFERENCE_ROUNDING = 1e-5
+
+# 関数が対象とする範囲。評価範囲の格子点のうち、この範囲に入るもののみで誤差を評価する
+# 各項目: 関数名: (範囲の説明, 格子点(t, rh)から対象の格子点を選ぶ関数)
+SUPPORTED_RANGE = {
+    'tdb_rh2tdp': ('露点温度0.01℃以上（水に対する飽和で計算し、-20℃未満は-20℃とするため）',
+                   lambda t, rh: tdp_ref(t, rh) >= 0.01),
+    'tdb_rh2twb': ('湿球温度0.01℃以上（水に対する飽和で計算するため）', lambda t, rh: twb_ref(t, rh) >= 0.01),
+    'tdb_twb2w': ('湿球温度0.01℃以上（水に対する飽和で計算するため）', lambda t, rh: twb_ref(t, rh) >= 0.01),
+}
+
+# 対象とする範囲でも計算式そのものの誤差が基準を超える関数。誤差は出力するが、合否判定（終了コード）には含めない
+NOT_GATED = {
+    'tdb_rh2twb': 'Sprungの式による近似のため、低湿度で湿球温度を高めに評価する',
+}
+
+# 飽和水蒸気圧の参照値[kPa]（下記の参照式（IAPWS）による値を有効数字6桁に丸めたもの。0.01℃未満は氷の昇華圧）
+# 式の実装の確認を兼ねるため、参照式とは別に数値で持つ
+PSAT_REFERENCE_TABLE = [
+    (-40.0, 0.0128412),
+    (-30.0, 0.0380051),
+    (-20.0, 0.103239),
+    (-10.0, 0.259874),
+    (0.01, 0.611657),
+    (10.0, 1.22811),
+    (20.0, 2.33919),
+    (25.0, 3.16982),
+    (30.0, 4.24692),
+    (40.0, 7.38511),
+    (50.0, 12.3525),
+    (60.0, 19.9474),
+    (80.0, 47.4158),
+    (100.0, 101.418),
+]
+
+
+# 参照式 #######################################################################
+def psat_water_ref(t):
+    tc = 647.096
+    pc = 22064.0
+    tau = 1 - (np.asarray(t, dtype=float) + 273.15) / tc
+    a = (-7.85951783, 1.84408259, -11.7866497, 22.6807411, -15.9618719, 1.80122502)
+    s = a[0] * tau + a[1] * tau ** 1.5 + a[2] * tau ** 3 + a[3] * tau ** 3.5 + a[4] * tau ** 4 + a[5] * tau ** 7.5
+    return pc * np.exp(s / (1 - tau))
+
+
+def psat_ice_ref(t):
+    theta = (np.asarray(t, dtype=float) + 273.15) / 273.16
+    a = (-0.212144006e2, 0.273203819e2, -0.610598130e1)
+    b = (0.333333333e-2, 0.120666667e1, 0.170333333e1)
+    s = a[0] * theta ** b[0] + a[1] * theta ** b[1] + a[2] * theta ** b[2]
+    return 0.611657 * np.exp(s / theta)
+
+
+def psat_ref(t):
+    t = np.asarray(t, dtype=float)
+    return np.where(t < 0.01, psat_ice_ref(np.minimum(t, 0.01)), psat_water_ref(np.maximum(t, 0.01)))
+
+
+def w_ref(t, rh):
+    pv_ = 0.01 * np.asarray(rh, dtype=float) * psat_ref(t)
+    return 0.621945 * pv_ / (P_ATM - pv_)
+
+
+def h_ref(t, w):
+    return 1.006 * t + w * (2501 + 1.86 * t)
+
+
+# 単調増加関数fについて、f(x) = yとなるxを区間[lo, hi]の二分法で求める（配列）
+def _bisect_vec(f, y, lo, hi, n=60):
+    lo = np.full(np.shape(y), lo, dtype=float)
+    hi = np.full(np.shape(y), hi, dtype=float) if np.isscalar(hi) else np.array(hi, dtype=float)
+    for _ in range(n):
+        mid = (lo + hi) / 2
+        below = f(mid) < y
+        lo = np.where(below, mid, lo)
+        hi = np.where(below, hi, mid)
+    return (lo + hi) / 2
+
+
+def tdp_ref(t, rh):
+    pv_ = 0.01 * np.asarray(rh, dtype=float) * psat_ref(t)
+    return _bisect_vec(psat_ref, pv_, -80.0, 120.0)
+
+
+# 湿球温度（ASHRAE Fundamentals 2017 式(33), (35)）
+def w_twb_ref(t, twb):
+    ws = w_ref(twb, 100.0)
+    water = ((2501 - 2.326 * twb) * ws - 1.006 * (t - twb)) / (2501 + 1.86 * t - 4.186 * twb)
+    ice = ((2830 - 0.24 * twb) * ws - 1.006 * (t - twb)) / (2830 + 1.86 * t - 2.1 * twb)
+    return np.where(twb >= 0, water, ice)
+
+
+def twb_ref(t, rh):
+    t = np.asarray(t, dtype=float)
+    w = w_ref(t, rh)
+    return _bisect_vec(lambda x: w_twb_ref(t, x), w, -80.0, t)
+
+
+def den_dry_ref(t):
+    return P_ATM / (0.287042 * (np.asarray(t, dtype=float) + 273.15))
+
+
+# 評価する関数 ##################################################################
+# 各項目: (関数名, 入力を与える関数, 参照値, 出力の種類)
+# 入力は格子点(t, rh)から作る。逆関数は、参照式で作った入力から元の値を復元できるかで評価する。
+def _cases(t, rh):
+    w = w_ref(t, rh)
+    h = h_ref(t, w)
+    twb = twb_ref(t, rh)
+    psat = psat_ref(t)
+    return [
+        ('tdp2psat', (t,), psat, 'psat'),
+        ('tdb2psat', (t,), psat_water_ref(t), 'psat'),
+        ('psat2tdp', (psat,), t, 'tdb'),
+        ('tdb_rh2tdp', (t, rh), tdp_ref(t, rh), 'tdb'),
+        ('tdb_rh2twb', (t, rh), twb, 'tdb'),
+        ('tdb_rh2w', (t, rh), w, 'w'),
+        ('tdb_rh2h', (t, rh), h, 'h'),
+        ('tdb_rh2h_x:h', (t, rh), h, 'h'),
+        ('tdb_rh2h_x:w', (t, rh), w, 'w'),
+        ('tdb2hsat', (t,), h_ref(t, w_ref(t, 100.0)), 'h'),
+        ('tdb_w2h', (t, w), h, 'h'),
+        ('h_rh2tdb', (h, rh), t, 'tdb'),
+        ('h_rh2w', (h, rh), w, 'w'),
+        ('w_h2tdb', (w, h), t, 'tdb'),
+        ('w_rh2tdb', (w, rh), t, 'tdb'),
+        ('w_tdb2rh', (w, t), rh, 'rh'),
+        ('tdb_twb2w', (t, twb), w, 'w'),
+        ('tdb2den', (t,), den_dry_ref(t), 'den'),
+    ]
+
+
+def _scalar_function(name):
+    base, _, item = name.partition(':')
+    f = getattr(pv, base)
+    if item:
+        index = {'h': 0, 'w': 1}[item]
+        return base, lambda *args: f(*args)[index]
+    return base, f
+
+
+def _vector_function(name):
+    base, _, item = name.partition(':')
+    f = getattr(pv, base + '_vec', None)
+    if f is None:
+        return None
+    if item:
+        index = {'h': 0, 'w': 1}[item]
+        return lambda *args: f(*args)[index]
+    return f
+
+
+def run(n_t=71, n_rh=20, n_array=100000, repeat=3, tolerance=None, backend='formula'):
+    tolerance = dict(TOLERANCE, **(tolerance or {}))
+    pv.set_psat_backend(backend)
+    t, rh = np.meshgrid(np.linspace(TDB_MIN, TDB_MAX, n_t), np.linspace(RH_MIN, RH_MAX, n_rh))
+    t = t.ravel()
+    rh = rh.ravel()
+    rng = np.random.default_rng(0)
+    t_array = rng.uniform(TDB_MIN, TDB_MAX, n_array)
+    rh_array = rng.uniform(RH_MIN, RH_MAX, n_array)
+
+    results = {}
+    for (name, args, ref, kind), (_, args_array, _, _) in zip(_cases(t, rh), _cases(t_array, rh_array)):
+        base, f = _scalar_function(name)
+        value = np.array([f(*[float(a[i]) for a in args]) for i in range(len(t))])
+        supported = SUPPORTED_RANGE[name][1](t, rh) if name in SUPPORTED_RANGE else np.ones(len(t), dtype=bool)
+        index = np.flatnonzero(supported)
+        err = np.abs(value - ref)[index]
+        i_max = int(index[np.argmax(err)])
+
+        # スカラー版: 格子点を一巡する時間から1回あたりの時間を求める
+        inputs = [tuple(float(a[i]) for a in args) for i in range(len(t))]
+        t_scalar = min(timeit.repeat(lambda: [f(*x) for x in inputs], number=1, repeat=repeat)) / len(inputs)
+
+        result = {
+            'kind': kind,
+            'max_abs_error': float(err.max()),
+            'mean_abs_error': float(err.mean()),
+            'worst_input': [float(a[i_max]) for a in args],
+            'supported_range': SUPPORTED_RANGE[name][0] if name in SUPPORTED_RANGE else None,
+            'n_excluded': int(len(t) - len(index)),
+            'tolerance': tolerance[kind],
+            'pass': bool(err.max() <= tolerance[kind]),
+            'gated': name not in NOT_GATED,
+            'scalar_us_per_call': t_scalar * 1e6,
+        }
+
+        fv = _vector_function(name)
+        if fv is not None:
+            value_v = fv(*args)
+            t_array_call = min(timeit.repeat(lambda: fv(*args_array), number=1, repeat=repeat))
+            result['array_ns_per_element'] = t_array_call / n_array * 1e9
+            result['array_max_abs_diff_from_scalar'] = float(np.max(np.abs(value_v - value)))
+        results[name] = result
+
+    # 飽和水蒸気圧の参照値との比較。tdb2psatは水に対する式なので0.01℃以上のみ判定する
+    # goff_gratch（tdb_rh2h_x等で用いる式）は参考値として出力のみ
+    psat_table = []
+    for temp, p in PSAT_REFERENCE_TABLE:
+        row = {
+            'tdb': temp, 'reference': p,
+            'reference_formula': float(psat_ref(temp)),
+            'tdp2psat': pv.tdp2psat(temp),
+            'tdb2psat': pv.tdb2psat(temp),
+            'goff_gratch': float(pv._tdb2psat_mmhg_vec(temp)) * 101.325 / 760,
+        }
+        error = {'tdp2psat': abs(row['tdp2psat'] / p - 1)}
+        if temp >= 0.01:
+            error['tdb2psat'] = abs(row['tdb2psat'] / p - 1)
+        row['relative_error'] = error
+        row['pass'] = bool(abs(row['reference_formula'] / p - 1) <= PSAT_REFERENCE_ROUNDING
+                           and max(error.values()) <= tolerance['psat_table'])
+        psat_table.append(row)
+
+    pv.set_psat_backend('formula')
+    return {
+        'settings': {
+            'backend': backend, 'tdb_range': [TDB_MIN, TDB_MAX], 'rh_range': [RH_MIN, RH_MAX],
+            'n_grid': int(len(t)), 'n_array': n_array, 'repeat': repeat,
+            'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+        },
+        'functions': results,
+        'psat_reference_table': psat_table,
+        'pass': all(r['pass'] or not r['gated'] for r in results.values()) and all(r['pass'] for r in psat_table),
+    }
+
+
+def _print_summary(report, file=sys.stderr):
+    print('{:<16}{:>12}{:>10}{:>6}{:>12}{:>14}'.format('function', 'max error', 'tol', 'pass', 'scalar[us]',
+                                                       'array[ns/el]'), file=file)
+    for name, r in report['functions'].items():
+        array = '{:14.1f}'.format(r['array_ns_per_element']) if 'array_ns_per_element' in r else '{:>14}'.format('-')
+        result = ('ok' if r['pass'] else 'NG') + ('' if r['gated'] else '*')
+        print('{:<16}{:12.3g}{:10.3g}{:>6}{:12.2f}{}'.format(name, r['max_abs_error'], r['tolerance'], result,
+                                                             r['scalar_us_per_call'], array), file=file)
+    for name, reason in NOT_GATED.items():
+        print('* {}: 合否判定に含めない（{}）'.format(name, reason), file=file)
+    print('{:<16}{:>12}{:>12}{:>12}{:>6}'.format('psat table tdb', 'reference', 'tdp2psat', 'tdb2psat', 'pass'),
+          file=file)
+    for r in report['psat_reference_table']:
+        error = r['relative_error']
+        print('{:<16}{:12.6g}{:12.2e}{:>12}{:>6}'.format(
+            r['tdb'], r['reference'], error['tdp2psat'],
+            '{:.2e}'.format(error['tdb2psat']) if 'tdb2psat' in error else '-', 'ok' if r['pass'] else 'NG'),
+            file=file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default='-', help='JSONレポートの出力先（-の場合は標準出力）')
+    parser.add_argument('--backend', default='formula', choices=('formula', 'table'), help='飽和水蒸気圧の計算方法')
+    parser.add_argument('--tol', action='append', default=[], metavar='KIND=VALUE',
+                        help='許容誤差の上書き（KIND: {}）'.format(', '.join(TOLERANCE)))
+    parser.add_argument('--n-array', type=int, default=100000, help='配列版の計測に用いる要素数')
+    parser.add_argument('--repeat', type=int, default=3, help='計測の繰り返し回数（最小値を採用）')
+    args = parser.parse_args(argv)
+
+    tolerance = {}
+    for item in args.tol:
+        kind, _, value = item.partition('=')
+        if kind not in TOLERANCE:
+            parser.error('unknown tolerance kind: {}'.format(kind))
+        tolerance[kind] = float(value)
+
+    report = run(n_array=args.n_array, repeat=args.repeat, tolerance=tolerance, backend=args.backend)
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    _print_summary(report)
+    return 0 if report['pass'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
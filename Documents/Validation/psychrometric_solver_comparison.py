@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+露点温度・湿球温度の収束計算の比較
+
+tdb_rh2tdp（Newton法）とtdb_rh2twb（Halley法）の結果を、従来の二分法による実装と比較する。
+乾球温度0~45℃、相対湿度10~100%の格子点について以下を確認し、いずれかが許容誤差を超える場合は終了コード1を返す。
+- 従来の二分法との差（二分法は飽和水蒸気圧の差0.01で打ち切るため、その分の差を許容する）
+- 定義式（露点温度: 飽和水蒸気圧 = 水蒸気分圧、湿球温度: Sprungの式）の残差を温度に換算した値
+  （露点温度は従来どおり-20℃を下限とするため、-20℃未満となる条件は除く）
+- 配列版（*_vec）とスカラー版の差
+
+使い方（リポジトリのルートで実行）
+    python Documents/Validation/psychrometric_solver_comparison.py
+"""
+
+import argparse
+import math
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+import phyvac as pv  # noqa: E402
+
+# 比較範囲
+TDB_MIN = 0.0
+TDB_MAX = 45.0
+RH_MIN = 10.0
+RH_MAX = 100.0
+
+# 許容誤差['C]
+TOLERANCE = {
+    'bisection': 0.15,  # 従来の二分法との差
+    'residual': 1e-5,  # 定義式の残差（温度換算）
+    'vec': 1e-9,  # 配列版とスカラー版の差
+}
+
+
+# 従来の実装（二分法） ##########################################################
+def _psat_mmhg(t):
+    c = 373.16 / (273.16 + t)
+    b = c - 1
+    a = -7.90298 * b + 5.02808 * math.log10(c) - 1.3816 * 10 ** (-7) * (10 ** (11.344 * b / c) - 1) + 8.1328 * 10 ** (
+        -3) * (10 ** (-3.49149 * b) - 1)
+    return 760 * 10 ** a
+
+
+def tdb_rh2tdp_bisection(tdb, rh):
+    psat = _psat_mmhg(tdb)
+    x = 0.622 * (rh * psat) / 100 / (760 - rh * psat / 100)
+    psat = 100 * 760 * x / (100 * (0.622 + x))
+    psat0 = 0
+    tdp_max = tdb
+    tdp_min = -20
+    tdp = 0
+    cnt = 0
+    while (psat - psat0 < -0.01) or (psat - psat0 > 0.01):
+        tdp = (tdp_max + tdp_min) / 2
+        psat0 = _psat_mmhg(tdp)
+        if psat - psat0 > 0:
+            tdp_min = tdp
+        else:
+            tdp_max = tdp
+        cnt += 1
+        if cnt > 30:
+            break
+    return tdp
+
+
+def tdb_rh2twb_bisection(tdb, rh):
+    pv_1 = rh / 100 * pv.tdb2psat(tdb)
+    pv_2 = -99999
+    twb = 0
+    twb_max = 50
+    twb_min = -50
+    cnt = 0
+    while abs(pv_1 - pv_2) > 0.01:
+        twb = (twb_max + twb_min) / 2
+        pv_2 = pv.tdb2psat(twb) - 0.000662 * 101.325 * (tdb - twb)
+        if pv_1 - pv_2 > 0:
+            twb_min = twb
+        else:
+            twb_max = twb
+        cnt += 1
+        if cnt > 20:
+            break
+    return twb
+
+
+# 定義式の残差（温度換算） #####################################################
+def tdp_residual(tdb, rh, tdp):
+    psat = _psat_mmhg(tdb)
+    x = 0.622 * (rh * psat) / 100 / (760 - rh * psat / 100)
+    lnpsat = math.log(100 * 760 * x / (100 * (0.622 + x)))
+    lnpsat0, dlnpsat = pv._tdb2lnpsat_mmhg(tdp)
+    # 探索範囲の下限-20℃に収めた場合（露点温度が-20℃未満）は残差0とする
+    if tdp <= -20 and lnpsat0 >= lnpsat:
+        return 0.0
+    return abs(lnpsat0 - lnpsat) / dlnpsat
+
+
+def twb_residual(tdb, rh, twb):
+    a = 0.000662 * 101.325
+    psat_wb, dpsat_wb = pv._tdb2psat_dpsat(twb)
+    f = psat_wb - a * (tdb - twb) - rh / 100 * pv.tdb2psat(tdb)
+    return abs(f) / (dpsat_wb + a)
+
+
+def run(n_t=46, n_rh=91, tolerance=None):
+    tolerance = dict(TOLERANCE, **(tolerance or {}))
+    t, rh = np.meshgrid(np.linspace(TDB_MIN, TDB_MAX, n_t), np.linspace(RH_MIN, RH_MAX, n_rh))
+    t = t.ravel()
+    rh = rh.ravel()
+
+    results = {}
+    for name, new, new_vec, old, residual in [
+            ('tdb_rh2tdp', pv.tdb_rh2tdp, pv.tdb_rh2tdp_vec, tdb_rh2tdp_bisection, tdp_residual),
+            ('tdb_rh2twb', pv.tdb_rh2twb, pv.tdb_rh2twb_vec, tdb_rh2twb_bisection, twb_residual)]:
+        value = np.array([new(float(a), float(b)) for a, b in zip(t, rh)])
+        value_old = np.array([old(float(a), float(b)) for a, b in zip(t, rh)])
+        errors = {
+            'bisection': np.abs(value - value_old),
+            'residual': np.array([residual(float(a), float(b), v) for a, b, v in zip(t, rh, value)]),
+            'vec': np.abs(new_vec(t, rh) - value),
+        }
+        for kind, err in errors.items():
+            i_max = int(np.argmax(err))
+            results[(name, kind)] = {
+                'max_abs_error': float(err[i_max]),
+                'worst_input': [float(t[i_max]), float(rh[i_max])],
+                'tolerance': tolerance[kind],
+                'pass': bool(err[i_max] <= tolerance[kind]),
+            }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tol', action='append', default=[], metavar='KIND=VALUE',
+                        help='許容誤差の上書き（KIND: {}）'.format(', '.join(TOLERANCE)))
+    args = parser.parse_args(argv)
+
+    tolerance = {}
+    for item in args.tol:
+        kind, _, value = item.partition('=')
+        if kind not in TOLERANCE:
+            parser.error('unknown tolerance kind: {}'.format(kind))
+        tolerance[kind] = float(value)
+
+    results = run(tolerance=tolerance)
+    print('{:<12}{:<11}{:>12}{:>10}{:>6}  {}'.format('function', 'check', 'max error', 'tol', 'pass', 'worst (tdb, rh)'))
+    for (name, kind), r in results.items():
+        print('{:<12}{:<11}{:12.3g}{:10.3g}{:>6}  ({:.1f}, {:.1f})'.format(
+            name, kind, r['max_abs_error'], r['tolerance'], 'ok' if r['pass'] else 'NG', *r['worst_input']))
+    return 0 if all(r['pass'] for r in results.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,13 +7,16 @@
 # ver20231120
 print("phyvac: ver20231120")
 import math
+import bisect
+import os
+import hashlib
+import json
 import traceback
+from collections import OrderedDict
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from scipy.interpolate import RegularGridInterpolator
 from scipy import optimize
-from sklearn.linear_model import LinearRegression
+from scipy import integrate, special
 
 
 # 空気状態関数　###############################################################
@@ -37,9 +40,36 @@ CA = 1.006  # 乾き空気の定圧比熱 [kJ/kg・K]
 CV = 1.86  # 水蒸気の定圧比熱 [kJ/kg・K]
 R0 = 2.501 * 10 ** 3  # 0'Cの水の蒸発潜熱 [kJ/kg]
 
+# 飽和水蒸気圧の計算方法（tdp2psat, psat2tdp, tdb2psatとその配列版に適用される）
+# 'formula' :式をそのまま計算する
+# 'table'   :PSAT_TABLE_TMIN~PSAT_TABLE_TMAXで事前計算した数表を3次エルミート補間する。範囲外は式で計算する。
+#            set_psat_backend('table')で切り替える。誤差はpsat_table_error()を参照
+PSAT_BACKEND = 'formula'
+PSAT_TABLE_TMIN = -40.0
+PSAT_TABLE_TMAX = 100.0
+PSAT_TABLE_STEP = 0.5  # 数表の刻み幅['C]
+
+
+# Goff-Gratchの式による飽和水蒸気圧psat[mmHg]の対数ln(psat)と、その温度微分[1/K]
+def _tdb2lnpsat_mmhg(tdb):
+    c = 373.16 / (273.16 + tdb)
+    b = c - 1
+    e1 = 10 ** (11.344 * b / c)
+    e2 = 10 ** (-3.49149 * b)
+    a = -7.90298 * b + 5.02808 * math.log10(c) - 1.3816 * 10 ** (-7) * (e1 - 1) + 8.1328 * 10 ** (-3) * (e2 - 1)
+    ln10 = 2.302585092994046
+    lnpsat = math.log(760) + a * ln10
+    # d(ln psat)/dT = ln10 * da/dc * dc/dT
+    da_dc = -7.90298 + 5.02808 / (c * ln10) - 1.3816 * 10 ** (-7) * e1 * ln10 * 11.344 / c ** 2 \
+        - 8.1328 * 10 ** (-3) * e2 * ln10 * 3.49149
+    dlnpsat = ln10 * da_dc * (-c / (273.16 + tdb))
+    return lnpsat, dlnpsat
+
 
 # 乾球温度と相対湿度から露点温度['C]
-def tdb_rh2tdp(tdb, rh):
+# ln(psat)についてのニュートン法。Magnus式による初期値から2~3回で収束する。
+# tol: 露点温度の収束判定値['C]
+def tdb_rh2tdp(tdb, rh, tol=1e-6, maxiter=20):
     # 飽和水蒸気圧psat[mmHg]の計算
     c = 373.16 / (273.16 + tdb)
     b = c - 1
@@ -51,32 +81,23 @@ def tdb_rh2tdp(tdb, rh):
 
     # この絶対湿度で相対湿度100%となる飽和水蒸気圧psat
     psat = 100 * 760 * x / (100 * (0.622 + x))
-    psat0 = 0
-    tdp_max = tdb
-    tdp_min = -20
-    tdp = 0
-    cnt = 0
-    # 飽和水蒸気圧が上のpsatの値となる温度twb
-    while (psat - psat0 < -0.01) or (psat - psat0 > 0.01):
-
-        tdp = (tdp_max + tdp_min) / 2
-
-        c = 373.16 / (273.16 + tdp)
-        b = c - 1
-        a = -7.90298 * b + 5.02808 * math.log10(c) - 1.3816 * 10 ** (-7) * (
-                10 ** (11.344 * b / c) - 1) + 8.1328 * 10 ** (-3) * (10 ** (-3.49149 * b) - 1)
-        psat0 = 760 * 10 ** a
-
-        if psat - psat0 > 0:
-            tdp_min = tdp
-        else:
-            tdp_max = tdp
-
-        cnt += 1
-        if cnt > 30:
+    if psat <= 0:
+        return -20.0
+
+    # 飽和水蒸気圧が上のpsatの値となる温度tdp
+    # Magnus式（psat[hPa] = 6.112 * exp(17.62 * t / (243.12 + t))）の逆関数を初期値とする
+    y = math.log(psat * 1.333224 / 6.112)
+    tdp = 243.12 * y / (17.62 - y)
+    lnpsat = math.log(psat)
+    for _ in range(maxiter):
+        lnpsat0, dlnpsat = _tdb2lnpsat_mmhg(tdp)
+        dt = (lnpsat0 - lnpsat) / dlnpsat
+        tdp -= dt
+        if abs(dt) < tol:
             break
 
-    return tdp
+    # 従来の二分法の探索範囲[-20, tdb]に収める
+    return min(max(tdp, -20), tdb)
 
 
 # 乾球温度tdbと相対湿度rhから比エンタルピーh[kJ/kg']と絶対湿度x[kg/kg']
@@ -95,6 +116,8 @@ def tdb_rh2h_x(tdb, rh):
 
 # 乾球温度から飽和水蒸気圧[kPa]
 def tdb2psat(tdb):
+    if PSAT_BACKEND == 'table' and PSAT_TABLE_TMIN <= tdb <= PSAT_TABLE_TMAX:
+        return _psat_table_eval('tdb2psat', tdb)
     # Wagner equation
     x = (1 - (tdb + 273.15) / 647.3)
     psat = 221200 * math.exp(
@@ -102,30 +125,54 @@ def tdb2psat(tdb):
     return psat / 10  # [hPa] -> [kPa]
 
 
+# 乾球温度から飽和水蒸気圧[kPa](tdb2psat)とその温度微分[kPa/K]（PSAT_BACKENDに従う）
+def _tdb2psat_dpsat(tdb):
+    if PSAT_BACKEND == 'table' and PSAT_TABLE_TMIN <= tdb <= PSAT_TABLE_TMAX:
+        return _psat_table_eval_d('tdb2psat', tdb)
+    return _tdb2psat_dpsat_formula(tdb)
+
+
+def _tdb2psat_dpsat_formula(tdb):
+    x = (1 - (tdb + 273.15) / 647.3)
+    s = math.sqrt(x)
+    x2 = x * x
+    x3 = x2 * x
+    f = -7.76451 * x + 1.45838 * x * s + -2.7758 * x3 - 1.23303 * x3 * x3
+    df = -7.76451 + 1.5 * 1.45838 * s + 3 * -2.7758 * x2 - 6 * 1.23303 * x3 * x2
+    psat = 22120 * math.exp(f / (1 - x))  # [kPa]
+    # d/dT = d/dx * dx/dT,  dx/dT = -1/647.3
+    dpsat = psat * (df * (1 - x) + f) / (1 - x) ** 2 * (-1 / 647.3)
+    return psat, dpsat
+
+
+# 乾球温度から飽和水蒸気圧(tdb2psat)の温度微分[kPa/K]
+def tdb2dpsat(tdb):
+    return _tdb2psat_dpsat(tdb)[1]
+
+
 # 乾球温度と相対湿度から湿球温度['C]
-def tdb_rh2twb(tdb, rh):
-    psat = tdb2psat(tdb)
+# Sprungの式についてのHalley法。残差は湿球温度について単調増加・下に凸なので、乾球温度から始めると2~4回で収束する。
+# 2階微分はd2psat/dT2 ≒ (dpsat/dT)^2/psatで近似する。
+# tol: 湿球温度の収束判定値['C]
+def tdb_rh2twb(tdb, rh, tol=1e-6, maxiter=20):
+    psat, dpsat = _tdb2psat_dpsat(tdb)
     pv_1 = rh / 100 * psat
-    pv_2 = -99999
-    twb = 0
-    twb_max = 50
-    twb_min = -50
-    cnt = 0
-    while abs(pv_1 - pv_2) > 0.01:
-        twb = (twb_max + twb_min) / 2
+    a = 0.000662 * 101.325
+    twb = tdb
+    psat_wb = psat
+    dpsat_wb = dpsat
+    for _ in range(maxiter):
         # Sprung equation
-        pv_2 = tdb2psat(twb) - 0.000662 * 101.325 * (tdb - twb)
-
-        if pv_1 - pv_2 > 0:
-            twb_min = twb
-        else:
-            twb_max = twb
-
-        cnt += 1
-        if cnt > 20:
+        f = psat_wb - a * (tdb - twb) - pv_1
+        df = dpsat_wb + a
+        dt = f / df / (1 - f * dpsat_wb ** 2 / psat_wb / (2 * df ** 2))
+        twb -= dt
+        if abs(dt) < tol:
             break
+        psat_wb, dpsat_wb = _tdb2psat_dpsat(twb)
 
-    return twb
+    # 従来の二分法の探索範囲[-50, 50]に収める
+    return min(max(twb, -50), 50)
 
 
 # 乾球温度と絶対湿度から比エンタルピー[kJ/kg']
@@ -141,6 +188,20 @@ def tdb2hsat(tdb):
     return hsat
 
 
+# 乾球温度から飽和空気の比エンタルピー[kJ/kg']とその温度微分dhsat/dT[kJ/(kg'K)]（解析解）
+def _tdb2hsat_dhsat(tdb, p_atm=101.325):
+    psat, dpsat = _tdp2psat_dpsat(tdb)
+    wsat = 0.622 * psat / (p_atm - psat)
+    dwsat = 0.622 * p_atm / (p_atm - psat) ** 2 * dpsat
+    hsat = CA * tdb + (CV * tdb + R0) * wsat
+    return hsat, CA + CV * wsat + (CV * tdb + R0) * dwsat
+
+
+# 乾球温度から飽和空気の比エンタルピーの温度微分dhsat/dT[kJ/(kg'K)]
+def tdb2dhsat(tdb):
+    return _tdb2hsat_dhsat(tdb)[1]
+
+
 # 絶対湿度から蒸気圧[kPa]
 def w2pv(w, p_atm=101.325):
     return p_atm * w / (0.622 + w)
@@ -154,6 +215,8 @@ def pv2w(pv, p_atm=101.325):
 
 # 露点温度から飽和水蒸気圧[単位不明、おそらくkPaだが…]
 def tdp2psat(tdp):
+    if PSAT_BACKEND == 'table' and PSAT_TABLE_TMIN <= tdp <= PSAT_TABLE_TMAX:
+        return _psat_table_eval('tdp2psat', tdp)
     p_convert = 0.001
 
     c1 = -5.6745359e3
@@ -190,11 +253,68 @@ def tdp2psat(tdp):
     return psat
 
 
+# 露点温度から飽和水蒸気圧[kPa](tdp2psat)とその温度微分[kPa/K]（PSAT_BACKENDに従う）
+def _tdp2psat_dpsat(tdp):
+    if PSAT_BACKEND == 'table' and PSAT_TABLE_TMIN <= tdp <= PSAT_TABLE_TMAX:
+        return _psat_table_eval_d('tdp2psat', tdp)
+    return _tdp2psat_dpsat_formula(tdp)
+
+
+def _tdp2psat_dpsat_formula(tdp):
+    p_convert = 0.001
+
+    c1 = -5.6745359e3
+    c2 = 6.3925247
+    c3 = -9.6778430e-3
+    c4 = 6.2215701e-7
+    c5 = 2.0747825e-9
+    c6 = -9.4840240e-13
+    c7 = 4.1635019
+
+    n1 = 0.11670521452767e4
+    n2 = -0.72421316703206e6
+    n3 = -0.17073846940092e2
+    n4 = 0.12020824702470e5
+    n5 = -0.32325550322333e7
+    n6 = 0.14915108613530e2
+    n7 = -0.4823265731591e4
+    n8 = 0.40511340542057e6
+    n9 = -0.23855557567849e0
+    n10 = 0.65017534844798e3
+
+    t = tdp + 273.15
+    if tdp < 0.01:
+        psat = math.exp(c1 / t + c2 + c3 * t + c4 * t ** 2 + c5 * t ** 3 + c6 * t ** 4 + c7 * math.log(t)) * p_convert
+        dpsat = psat * (-c1 / t ** 2 + c3 + 2 * c4 * t + 3 * c5 * t ** 2 + 4 * c6 * t ** 3 + c7 / t)
+
+    else:
+        alpha = t + n9 / (t - n10)
+        a2 = alpha ** 2
+        a = a2 + n1 * alpha + n2
+        b = n3 * a2 + n4 * alpha + n5
+        c = n6 * a2 + n7 * alpha + n8
+        d = pow(b ** 2 - 4 * a * c, 0.5)
+        u = 2 * c / (-b + d)
+        psat = pow(u, 4) / p_convert
+        # alphaについての微分
+        da = 2 * alpha + n1
+        db = 2 * n3 * alpha + n4
+        dc = 2 * n6 * alpha + n7
+        dd = (b * db - 2 * (da * c + a * dc)) / d
+        du = 2 * (dc * (-b + d) - c * (-db + dd)) / (-b + d) ** 2
+        dpsat = 4 * pow(u, 3) * du / p_convert * (1 - n9 / (t - n10) ** 2)
+
+    return psat, dpsat
+
+
+# 露点温度から飽和水蒸気圧(tdp2psat)の温度微分[kPa/K]
+def tdp2dpsat(tdp):
+    return _tdp2psat_dpsat(tdp)[1]
+
+
 # 比エンタルピーと相対湿度から絶対湿度[kg/kg']
 def h_rh2w(h, rh):
-    tdb = h_rh2tdb(h, rh)
-    w = tdb_rh2w(tdb, rh)
-    return w
+    return _h_rh2tdb_w(h, rh)[1]
 
 
 # 乾球温度から密度[kg/m^3]
@@ -203,11 +323,36 @@ def tdb2den(tdb):
 
 
 # 比エンタルピーと相対湿度から乾球温度['C]
-def h_rh2tdb(h, rh):
-    def h_rh2tdb_fun(tdb):
-        return h - tdb_rh2h(tdb, rh)
+def h_rh2tdb(h, rh, tol=1e-6, maxiter=20):
+    return _h_rh2tdb_w(h, rh, tol, maxiter)[0]
+
+
+# h_rh2tdb, h_rh2wで用いる20℃における飽和水蒸気圧とその微分
+_PSAT_20, _DPSAT_20 = _tdp2psat_dpsat_formula(20.0)
 
-    return optimize.newton(h_rh2tdb_fun, x0=1e-5, tol=1e-4, maxiter=20)
+
+# 比エンタルピーと相対湿度から乾球温度['C]と絶対湿度[kg/kg']
+# h(T) = CA*T + (R0 + CV*T)*w(T)についてのNewton法。初期値は20℃で線形化したhの関係から求める。
+# hは温度について単調増加・下に凸なので、初期値以降は単調に収束する（通常2~3回）。
+# tol: 乾球温度の収束判定値['C]
+def _h_rh2tdb_w(h, rh, tol=1e-6, maxiter=20):
+    p_atm = 101.325
+    pv = 0.01 * rh * _PSAT_20
+    w = 0.622 * pv / (p_atm - pv)
+    dw = 0.622 * p_atm / (p_atm - pv) ** 2 * 0.01 * rh * _DPSAT_20
+    tdb = 20.0 + (h - CA * 20.0 - (R0 + CV * 20.0) * w) / (CA + CV * w + (R0 + CV * 20.0) * dw)
+    for _ in range(maxiter):
+        psat, dpsat = _tdp2psat_dpsat(tdb)
+        pv = 0.01 * rh * psat
+        w = 0.622 * pv / (p_atm - pv)
+        dw = 0.622 * p_atm / (p_atm - pv) ** 2 * 0.01 * rh * dpsat
+        dt = (CA * tdb + (R0 + CV * tdb) * w - h) / (CA + CV * w + (R0 + CV * tdb) * dw)
+        tdb -= dt
+        if abs(dt) < tol:
+            break
+    # 最後の更新に合わせた絶対湿度（|dt| < tolなので線形補正で十分）
+    w -= dw * dt
+    return tdb, w
 
 
 # 乾球温度と相対湿度から比エンタルピー[kJ/kg']
@@ -227,6 +372,10 @@ def tdb_rh2w(tdb, rh):
 
 # 飽和水蒸気圧から露点温度['C]
 def psat2tdp(psat):
+    if PSAT_BACKEND == 'table':
+        table = _psat_table()
+        if table['pmin'] <= psat <= table['pmax']:
+            return _psat_table_eval('psat2tdp', math.log(psat))
     p_convert = 0.001
 
     d1 = -6.0662e1
@@ -298,24 +447,601 @@ def tdb_twb2w(tdb, twb):
     return a / b
 
 
+# 空気状態関数（配列版） ########################################################
+# 上記の空気状態関数と同じ式をnumpy配列で一括計算する。関数名は上記の関数名+'_vec'。
+# 入力はスカラー・配列のいずれでもよく、numpyのブロードキャストに従う。
+# 気象データ1年分などの前処理を関数呼び出し1回で行うためのもの。
+
+# Goff-Gratchの式による飽和水蒸気圧[mmHg]（tdb_rh2tdp, tdb_rh2h_xで使用）
+def _tdb2psat_mmhg_vec(tdb):
+    c = 373.16 / (273.16 + tdb)
+    b = c - 1
+    a = -7.90298 * b + 5.02808 * np.log10(c) - 1.3816 * 10 ** (-7) * (10 ** (11.344 * b / c) - 1) + 8.1328 * 10 ** (
+        -3) * (10 ** (-3.49149 * b) - 1)
+    return 760 * 10 ** a
+
+
+def _tdb2lnpsat_mmhg_vec(tdb):
+    c = 373.16 / (273.16 + tdb)
+    b = c - 1
+    e1 = 10 ** (11.344 * b / c)
+    e2 = 10 ** (-3.49149 * b)
+    a = -7.90298 * b + 5.02808 * np.log10(c) - 1.3816 * 10 ** (-7) * (e1 - 1) + 8.1328 * 10 ** (-3) * (e2 - 1)
+    ln10 = 2.302585092994046
+    lnpsat = math.log(760) + a * ln10
+    da_dc = -7.90298 + 5.02808 / (c * ln10) - 1.3816 * 10 ** (-7) * e1 * ln10 * 11.344 / c ** 2 \
+        - 8.1328 * 10 ** (-3) * e2 * ln10 * 3.49149
+    dlnpsat = ln10 * da_dc * (-c / (273.16 + tdb))
+    return lnpsat, dlnpsat
+
+
+def tdb_rh2tdp_vec(tdb, rh, tol=1e-6, maxiter=20):
+    tdb, rh = np.broadcast_arrays(np.asarray(tdb, dtype=float), np.asarray(rh, dtype=float))
+    psat = _tdb2psat_mmhg_vec(tdb)
+    x = 0.622 * (rh * psat) / 100 / (760 - rh * psat / 100)
+    psat = 100 * 760 * x / (100 * (0.622 + x))
+    dry = psat <= 0
+    psat = np.where(dry, 1.0, psat)
+
+    # tdb_rh2tdpと同じニュートン法を、未収束の要素についてのみ進める
+    y = np.log(psat * 1.333224 / 6.112)
+    tdp = 243.12 * y / (17.62 - y)
+    lnpsat = np.log(psat)
+    active = ~dry
+    for _ in range(maxiter):
+        if not active.any():
+            break
+        lnpsat0, dlnpsat = _tdb2lnpsat_mmhg_vec(tdp)
+        dt = np.where(active, (lnpsat0 - lnpsat) / dlnpsat, 0.0)
+        tdp = tdp - dt
+        active = active & (np.abs(dt) >= tol)
+
+    tdp = np.where(dry, -20.0, tdp)
+    return np.minimum(np.maximum(tdp, -20), tdb)
+
+
+def tdb_rh2h_x_vec(tdb, rh):
+    psat = _tdb2psat_mmhg_vec(tdb)
+    w = 0.622 * (rh * psat) / 100 / (760 - rh * psat / 100)
+    h = CA * tdb + (R0 + CV * tdb) * w
+
+    return [h, w]
+
+
+def tdb2psat_vec(tdb):
+    if PSAT_BACKEND == 'table':
+        return _psat_table_eval_vec('tdb2psat', tdb, _tdb2psat_formula_vec)
+    return _tdb2psat_formula_vec(tdb)
+
+
+def _tdb2psat_formula_vec(tdb):
+    x = (1 - (np.asarray(tdb, dtype=float) + 273.15) / 647.3)
+    psat = 221200 * np.exp(
+        (-7.76451 * x + 1.45838 * x ** 1.5 + -2.7758 * x ** 3 - 1.23303 * x ** 6) / (1 - x))  # [hPa]
+    return psat / 10  # [hPa] -> [kPa]
+
+
+def _tdb2psat_dpsat_vec(tdb):
+    if PSAT_BACKEND == 'table':
+        return _psat_table_eval_d_vec('tdb2psat', tdb, _tdb2psat_dpsat_formula_vec)
+    return _tdb2psat_dpsat_formula_vec(tdb)
+
+
+def _tdb2psat_dpsat_formula_vec(tdb):
+    x = (1 - (np.asarray(tdb, dtype=float) + 273.15) / 647.3)
+    s = np.sqrt(x)
+    x2 = x * x
+    x3 = x2 * x
+    f = -7.76451 * x + 1.45838 * x * s + -2.7758 * x3 - 1.23303 * x3 * x3
+    df = -7.76451 + 1.5 * 1.45838 * s + 3 * -2.7758 * x2 - 6 * 1.23303 * x3 * x2
+    psat = 22120 * np.exp(f / (1 - x))  # [kPa]
+    dpsat = psat * (df * (1 - x) + f) / (1 - x) ** 2 * (-1 / 647.3)
+    return psat, dpsat
+
+
+def tdb2dpsat_vec(tdb):
+    return _tdb2psat_dpsat_vec(tdb)[1]
+
+
+def tdb_rh2twb_vec(tdb, rh, tol=1e-6, maxiter=20):
+    tdb, rh = np.broadcast_arrays(np.asarray(tdb, dtype=float), np.asarray(rh, dtype=float))
+    psat, dpsat = _tdb2psat_dpsat_vec(tdb)
+    pv_1 = rh / 100 * psat
+    a = 0.000662 * 101.325
+
+    # tdb_rh2twbと同じHalley法を、未収束の要素についてのみ進める
+    twb = tdb.copy()
+    psat_wb = psat
+    dpsat_wb = dpsat
+    active = np.ones(twb.shape, dtype=bool)
+    for _ in range(maxiter):
+        f = psat_wb - a * (tdb - twb) - pv_1
+        df = dpsat_wb + a
+        dt = np.where(active, f / df / (1 - f * dpsat_wb ** 2 / psat_wb / (2 * df ** 2)), 0.0)
+        twb = twb - dt
+        active = active & (np.abs(dt) >= tol)
+        if not active.any():
+            break
+        psat_wb, dpsat_wb = _tdb2psat_dpsat_vec(twb)
+
+    return np.minimum(np.maximum(twb, -50), 50)
+
+
+def tdb_w2h_vec(tdb, w):
+    return CA * np.asarray(tdb, dtype=float) + (CV * np.asarray(tdb, dtype=float) + R0) * np.asarray(w, dtype=float)
+
+
+def tdb2hsat_vec(tdb):
+    psat = tdp2psat_vec(tdb)
+    wsat = pv2w_vec(psat)
+    hsat = tdb_w2h_vec(tdb, wsat)
+    return hsat
+
+
+def _tdb2hsat_dhsat_vec(tdb, p_atm=101.325):
+    tdb = np.asarray(tdb, dtype=float)
+    psat, dpsat = _tdp2psat_dpsat_vec(tdb)
+    wsat = 0.622 * psat / (p_atm - psat)
+    dwsat = 0.622 * p_atm / (p_atm - psat) ** 2 * dpsat
+    hsat = CA * tdb + (CV * tdb + R0) * wsat
+    return hsat, CA + CV * wsat + (CV * tdb + R0) * dwsat
+
+
+def tdb2dhsat_vec(tdb):
+    return _tdb2hsat_dhsat_vec(tdb)[1]
+
+
+def w2pv_vec(w, p_atm=101.325):
+    w = np.asarray(w, dtype=float)
+    return p_atm * w / (0.622 + w)
+
+
+def pv2w_vec(pv, p_atm=101.325):
+    pv = np.asarray(pv, dtype=float)
+    w = 0.622 * pv / (p_atm - pv)
+    return w
+
+
+def tdp2psat_vec(tdp):
+    if PSAT_BACKEND == 'table':
+        return _psat_table_eval_vec('tdp2psat', tdp, _tdp2psat_formula_vec)
+    return _tdp2psat_formula_vec(tdp)
+
+
+def _tdp2psat_formula_vec(tdp):
+    p_convert = 0.001
+
+    c1 = -5.6745359e3
+    c2 = 6.3925247
+    c3 = -9.6778430e-3
+    c4 = 6.2215701e-7
+    c5 = 2.0747825e-9
+    c6 = -9.4840240e-13
+    c7 = 4.1635019
+
+    n1 = 0.11670521452767e4
+    n2 = -0.72421316703206e6
+    n3 = -0.17073846940092e2
+    n4 = 0.12020824702470e5
+    n5 = -0.32325550322333e7
+    n6 = 0.14915108613530e2
+    n7 = -0.4823265731591e4
+    n8 = 0.40511340542057e6
+    n9 = -0.23855557567849e0
+    n10 = 0.65017534844798e3
+
+    tdp = np.asarray(tdp, dtype=float)
+    t = tdp + 273.15
+    # 氷点下
+    psat_ice = np.exp(c1 / t + c2 + c3 * t + c4 * t ** 2 + c5 * t ** 3 + c6 * t ** 4 + c7 * np.log(t)) * p_convert
+    # 水
+    alpha = t + n9 / (t - n10)
+    a2 = alpha ** 2
+    a = a2 + n1 * alpha + n2
+    b = n3 * a2 + n4 * alpha + n5
+    c = n6 * a2 + n7 * alpha + n8
+    psat_water = (2 * c / (-b + (b ** 2 - 4 * a * c) ** 0.5)) ** 4 / p_convert
+
+    return np.where(tdp < 0.01, psat_ice, psat_water)
+
+
+def _tdp2psat_dpsat_vec(tdp):
+    if PSAT_BACKEND == 'table':
+        return _psat_table_eval_d_vec('tdp2psat', tdp, _tdp2psat_dpsat_formula_vec)
+    return _tdp2psat_dpsat_formula_vec(tdp)
+
+
+def _tdp2psat_dpsat_formula_vec(tdp, ice=None):
+    # ice: 氷点下の式を用いるか否か（Noneの場合はtdp < 0.01で判定）
+    p_convert = 0.001
+
+    c1 = -5.6745359e3
+    c2 = 6.3925247
+    c3 = -9.6778430e-3
+    c4 = 6.2215701e-7
+    c5 = 2.0747825e-9
+    c6 = -9.4840240e-13
+    c7 = 4.1635019
+
+    n1 = 0.11670521452767e4
+    n2 = -0.72421316703206e6
+    n3 = -0.17073846940092e2
+    n4 = 0.12020824702470e5
+    n5 = -0.32325550322333e7
+    n6 = 0.14915108613530e2
+    n7 = -0.4823265731591e4
+    n8 = 0.40511340542057e6
+    n9 = -0.23855557567849e0
+    n10 = 0.65017534844798e3
+
+    tdp = np.asarray(tdp, dtype=float)
+    t = tdp + 273.15
+    # 氷点下
+    psat_ice = np.exp(c1 / t + c2 + c3 * t + c4 * t ** 2 + c5 * t ** 3 + c6 * t ** 4 + c7 * np.log(t)) * p_convert
+    dpsat_ice = psat_ice * (-c1 / t ** 2 + c3 + 2 * c4 * t + 3 * c5 * t ** 2 + 4 * c6 * t ** 3 + c7 / t)
+    # 水
+    alpha = t + n9 / (t - n10)
+    a2 = alpha ** 2
+    a = a2 + n1 * alpha + n2
+    b = n3 * a2 + n4 * alpha + n5
+    c = n6 * a2 + n7 * alpha + n8
+    d = (b ** 2 - 4 * a * c) ** 0.5
+    u = 2 * c / (-b + d)
+    psat_water = u ** 4 / p_convert
+    da = 2 * alpha + n1
+    db = 2 * n3 * alpha + n4
+    dc = 2 * n6 * alpha + n7
+    dd = (b * db - 2 * (da * c + a * dc)) / d
+    du = 2 * (dc * (-b + d) - c * (-db + dd)) / (-b + d) ** 2
+    dpsat_water = 4 * u ** 3 * du / p_convert * (1 - n9 / (t - n10) ** 2)
+
+    if ice is None:
+        ice = tdp < 0.01
+    return np.where(ice, psat_ice, psat_water), np.where(ice, dpsat_ice, dpsat_water)
+
+
+def tdp2dpsat_vec(tdp):
+    return _tdp2psat_dpsat_vec(tdp)[1]
+
+
+def h_rh2w_vec(h, rh):
+    return _h_rh2tdb_w_vec(h, rh)[1]
+
+
+def tdb2den_vec(tdb):
+    return 1.293 * 273.3 / (273.2 + np.asarray(tdb, dtype=float))
+
+
+def h_rh2tdb_vec(h, rh, tol=1e-6, maxiter=20):
+    return _h_rh2tdb_w_vec(h, rh, tol, maxiter)[0]
+
+
+def _h_rh2tdb_w_vec(h, rh, tol=1e-6, maxiter=20):
+    h, rh = np.broadcast_arrays(np.asarray(h, dtype=float), np.asarray(rh, dtype=float))
+    p_atm = 101.325
+    pv = 0.01 * rh * _PSAT_20
+    w = 0.622 * pv / (p_atm - pv)
+    dw = 0.622 * p_atm / (p_atm - pv) ** 2 * 0.01 * rh * _DPSAT_20
+    tdb = 20.0 + (h - CA * 20.0 - (R0 + CV * 20.0) * w) / (CA + CV * w + (R0 + CV * 20.0) * dw)
+
+    # _h_rh2tdb_wと同じNewton法を、未収束の要素についてのみ進める
+    active = np.ones(tdb.shape, dtype=bool)
+    dt = np.zeros(tdb.shape)
+    for _ in range(maxiter):
+        psat, dpsat = _tdp2psat_dpsat_vec(tdb)
+        pv = 0.01 * rh * psat
+        w = 0.622 * pv / (p_atm - pv)
+        dw = 0.622 * p_atm / (p_atm - pv) ** 2 * 0.01 * rh * dpsat
+        dt = np.where(active, (CA * tdb + (R0 + CV * tdb) * w - h) / (CA + CV * w + (R0 + CV * tdb) * dw), 0.0)
+        tdb = tdb - dt
+        active = active & (np.abs(dt) >= tol)
+        if not active.any():
+            break
+    w = w - dw * dt
+    return tdb, w
+
+
+def tdb_rh2h_vec(tdb, rh):
+    w = tdb_rh2w_vec(tdb, rh)
+    h = tdb_w2h_vec(tdb, w)
+    return h
+
+
+def tdb_rh2w_vec(tdb, rh):
+    psat = tdp2psat_vec(tdb)
+    pv = 0.01 * np.asarray(rh, dtype=float) * psat
+    w = pv2w_vec(pv)
+    return w
+
+
+def psat2tdp_vec(psat):
+    if PSAT_BACKEND == 'table':
+        return _psat_table_eval_vec('psat2tdp', psat, _psat2tdp_formula_vec)
+    return _psat2tdp_formula_vec(psat)
+
+
+def _psat2tdp_formula_vec(psat, ice=None):
+    # ice: 氷点下の式を用いるか否か（Noneの場合はpsat < 0.611213で判定）
+    p_convert = 0.001
+
+    d1 = -6.0662e1
+    d2 = 7.4624
+    d3 = 2.0594e-1
+    d4 = 1.6321e-2
+
+    n1 = 0.11670521452767e4
+    n2 = -0.72421316703206e6
+    n3 = -0.17073846940092e2
+    n4 = 0.12020824702470e5
+    n5 = -0.32325550322333e7
+    n6 = 0.14915108613530e2
+    n7 = -0.4823265731591e4
+    n8 = 0.40511340542057e6
+    n9 = -0.23855557567849e0
+    n10 = 0.65017534844798e3
+
+    psat = np.asarray(psat, dtype=float)
+    # 氷点下
+    y = np.log(psat / p_convert)
+    tdp_ice = d1 + y * (d2 + y * (d3 + y * d4))
+    # 水
+    ps = psat * p_convert
+    beta = ps ** 0.25
+    b2 = beta ** 2
+    e = b2 + n3 * beta + n6
+    f = n1 * b2 + n4 * beta + n7
+    g = n2 * b2 + n5 * beta + n8
+    d = 2 * g / (-f - (f ** 2 - 4 * e * g) ** 0.5)
+    tdp_water = (n10 + d - ((n10 + d) ** 2 - 4 * (n9 + n10 * d)) ** 0.5) / 2 - 273.15
+
+    if ice is None:
+        ice = psat < 0.611213
+    return np.where(ice, tdp_ice, tdp_water)
+
+
+def w_h2tdb_vec(w, h):
+    w = np.asarray(w, dtype=float)
+    tdb = (np.asarray(h, dtype=float) - 2501 * w) / (1.006 + 1.86 * w)
+    return tdb
+
+
+def w_rh2tdb_vec(w, rh):
+    psat = w2pv_vec(w)
+    tdb = psat2tdp_vec(psat / np.asarray(rh, dtype=float) * 100)
+    return tdb
+
+
+def w2cpair_vec(w):
+    cpair = 1.006 + 1.86 * np.asarray(w, dtype=float)
+    return cpair
+
+
+def w_tdb2rh_vec(w, tdb):
+    pv = w2pv_vec(w)
+    psat = tdp2psat_vec(tdb)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rh = pv / psat * 100
+    return np.where(psat <= 0, 0.0, rh)
+
+
+def tdb_twb2w_vec(tdb, twb):
+    tdb = np.asarray(tdb, dtype=float)
+    twb = np.asarray(twb, dtype=float)
+    psat = tdp2psat_vec(twb)
+    wsat = pv2w_vec(psat)
+    a = wsat * (2501 + (1.86 - 4.186) * twb) + 1.006 * (twb - tdb)  # 4.186[kJ/kg･K] 水の比熱
+    b = 2501 + 1.86 * tdb - 4.186 * twb
+    return a / b
+
+
+# 飽和水蒸気圧の数表 ##########################################################
+# tdp2psat, tdb2psatは温度、psat2tdpはln(psat)について等間隔の節点を設け、節点の値と解析的な微分値から
+# 3次エルミート補間する。補間誤差は刻み幅hに対してh^4/384*max|f^(4)|以下で、
+# 刻み幅0.5℃（既定値）の場合の最大誤差は以下のとおり（psat_table_error()で確認できる）。
+#   tdp2psat: 6e-9 kPa,  tdb2psat: 6e-9 kPa,  psat2tdp: 5e-5 ℃
+# 氷点下の式と水の式の切り替え点（0.01℃, 0.611213kPa）で数表を分けているので、式の不連続もそのまま再現される。
+_PSAT_TABLE = None
+
+
+# 飽和水蒸気圧の計算方法を切り替える（'formula' or 'table'）
+def set_psat_backend(backend):
+    global PSAT_BACKEND
+    if backend not in ('formula', 'table'):
+        raise ValueError("backend must be 'formula' or 'table': {}".format(backend))
+    if backend == 'table':
+        _psat_table()
+    PSAT_BACKEND = backend
+
+
+# 区間[x0, x1]の数表。fは節点xにおける値と微分値を返す関数
+def _psat_table_segment(x0, x1, f):
+    n = max(int(math.ceil((x1 - x0) / PSAT_TABLE_STEP)), 1)
+    x = np.linspace(x0, x1, n + 1)
+    y, dy = f(x)
+    h = (x1 - x0) / n
+    return {'x0': x0, 'x1': x1, 'h': h, 'n': n, 'y': y, 'm': dy * h,
+            'y_list': y.tolist(), 'm_list': (dy * h).tolist()}
+
+
+# ln(psat)から露点温度とその微分dtdp/dln(psat)
+def _psat2tdp_dlnpsat_vec(lnpsat, ice):
+    psat = np.exp(lnpsat)
+    tdp = _psat2tdp_formula_vec(psat, ice=ice)
+    if ice:
+        y = lnpsat - math.log(0.001)
+        dtdp = 7.4624 + 2 * 2.0594e-1 * y + 3 * 1.6321e-2 * y ** 2
+    else:
+        # 水の式はtdp2psatの厳密な逆関数
+        dtdp = psat / _tdp2psat_dpsat_formula_vec(tdp, ice=False)[1]
+    return tdp, dtdp
+
+
+# 数表の作成（初回のみ）
+def _psat_table():
+    global _PSAT_TABLE
+    if _PSAT_TABLE is None:
+        tmin = PSAT_TABLE_TMIN
+        tmax = PSAT_TABLE_TMAX
+        pmin = float(_tdp2psat_formula_vec(tmin))
+        pmax = float(_tdp2psat_formula_vec(tmax))
+        p_split = 0.611213
+        _PSAT_TABLE = {
+            'tdp2psat': [_psat_table_segment(tmin, 0.01, lambda x: _tdp2psat_dpsat_formula_vec(x, ice=True)),
+                         _psat_table_segment(0.01, tmax, lambda x: _tdp2psat_dpsat_formula_vec(x, ice=False))],
+            'tdb2psat': [_psat_table_segment(tmin, tmax, _tdb2psat_dpsat_formula_vec)],
+            'psat2tdp': [_psat_table_segment(math.log(pmin), math.log(p_split),
+                                             lambda y: _psat2tdp_dlnpsat_vec(y, ice=True)),
+                         _psat_table_segment(math.log(p_split), math.log(pmax),
+                                             lambda y: _psat2tdp_dlnpsat_vec(y, ice=False))],
+            'pmin': pmin,
+            'pmax': pmax,
+        }
+    return _PSAT_TABLE
+
+
+# 数表の補間（スカラー）。xは温度またはln(psat)で、数表の範囲内であること
+def _psat_table_eval(name, x):
+    segs = (_PSAT_TABLE if _PSAT_TABLE is not None else _psat_table())[name]
+    seg = segs[0] if len(segs) == 1 or x < segs[0]['x1'] else segs[1]
+    s = (x - seg['x0']) / seg['h']
+    i = int(s)
+    if i >= seg['n']:
+        i = seg['n'] - 1
+    t = s - i
+    y = seg['y_list']
+    m = seg['m_list']
+    y0 = y[i]
+    y1 = y[i + 1]
+    m0 = m[i]
+    m1 = m[i + 1]
+    return y0 + t * (m0 + t * (3 * (y1 - y0) - 2 * m0 - m1 + t * (2 * (y0 - y1) + m0 + m1)))
+
+
+# 数表の補間値とその微分（スカラー）。xは温度で、数表の範囲内であること
+def _psat_table_eval_d(name, x):
+    segs = (_PSAT_TABLE if _PSAT_TABLE is not None else _psat_table())[name]
+    seg = segs[0] if len(segs) == 1 or x < segs[0]['x1'] else segs[1]
+    s = (x - seg['x0']) / seg['h']
+    i = int(s)
+    if i >= seg['n']:
+        i = seg['n'] - 1
+    t = s - i
+    y0 = seg['y_list'][i]
+    y1 = seg['y_list'][i + 1]
+    m0 = seg['m_list'][i]
+    m1 = seg['m_list'][i + 1]
+    a = 3 * (y1 - y0) - 2 * m0 - m1
+    b = 2 * (y0 - y1) + m0 + m1
+    return y0 + t * (m0 + t * (a + t * b)), (m0 + t * (2 * a + 3 * t * b)) / seg['h']
+
+
+def _psat_table_hermite_vec(seg, x):
+    s = (x - seg['x0']) / seg['h']
+    i = np.clip(s.astype(int), 0, seg['n'] - 1)
+    t = s - i
+    y0 = seg['y'][i]
+    y1 = seg['y'][i + 1]
+    m0 = seg['m'][i]
+    m1 = seg['m'][i + 1]
+    return y0 + t * (m0 + t * (3 * (y1 - y0) - 2 * m0 - m1 + t * (2 * (y0 - y1) + m0 + m1)))
+
+
+# 数表の補間（配列）。数表の範囲外の要素はformulaで計算する
+def _psat_table_eval_vec(name, x, formula):
+    x = np.asarray(x, dtype=float)
+    table = _psat_table()
+    if name == 'psat2tdp':
+        inside = (x >= table['pmin']) & (x <= table['pmax'])
+        xt = np.log(np.where(inside, x, table['pmin']))
+    else:
+        inside = (x >= PSAT_TABLE_TMIN) & (x <= PSAT_TABLE_TMAX)
+        xt = np.where(inside, x, PSAT_TABLE_TMIN)
+    segs = table[name]
+    y = _psat_table_hermite_vec(segs[-1], xt)
+    if len(segs) == 2:
+        y = np.where(xt < segs[0]['x1'], _psat_table_hermite_vec(segs[0], xt), y)
+    if not inside.all():
+        y = np.where(inside, y, formula(x))
+    return y
+
+
+# 数表の補間値とその微分（配列）。数表の範囲外の要素はformula（値と微分を返す）で計算する
+def _psat_table_eval_d_vec(name, x, formula):
+    x = np.asarray(x, dtype=float)
+    inside = (x >= PSAT_TABLE_TMIN) & (x <= PSAT_TABLE_TMAX)
+    xt = np.where(inside, x, PSAT_TABLE_TMIN)
+    segs = _psat_table()[name]
+    seg = np.where(xt < segs[0]['x1'], 0, len(segs) - 1)
+    y = np.empty(xt.shape)
+    dy = np.empty(xt.shape)
+    for k in set(seg.ravel().tolist()):
+        sk = segs[k]
+        mask = seg == k
+        s = (xt[mask] - sk['x0']) / sk['h']
+        i = np.clip(s.astype(int), 0, sk['n'] - 1)
+        t = s - i
+        y0 = sk['y'][i]
+        y1 = sk['y'][i + 1]
+        m0 = sk['m'][i]
+        m1 = sk['m'][i + 1]
+        a = 3 * (y1 - y0) - 2 * m0 - m1
+        b = 2 * (y0 - y1) + m0 + m1
+        y[mask] = y0 + t * (m0 + t * (a + t * b))
+        dy[mask] = (m0 + t * (2 * a + 3 * t * b)) / sk['h']
+    if not inside.all():
+        y_f, dy_f = formula(x)
+        y = np.where(inside, y, y_f)
+        dy = np.where(inside, dy, dy_f)
+    return y, dy
+
+
+# 数表の補間誤差（式との差の絶対値の最大値）。各区間をn_sub分割した点で確認する
+def psat_table_error(n_sub=20):
+    table = _psat_table()
+    error = {}
+    for name, formula in (('tdp2psat', _tdp2psat_formula_vec), ('tdb2psat', _tdb2psat_formula_vec),
+                          ('psat2tdp', _psat2tdp_formula_vec)):
+        e = 0.0
+        for seg in table[name]:
+            x = np.linspace(seg['x0'], seg['x1'], seg['n'] * n_sub + 1)[:-1]
+            y = np.array([_psat_table_eval(name, xi) for xi in x])
+            y_ref = formula(np.exp(x)) if name == 'psat2tdp' else formula(x)
+            e = max(e, float(np.max(np.abs(y - y_ref))))
+        error[name] = e
+    return error
+
+
 #######################
 # HEX function
 # 宇田川光弘：パソコンによる空気調和計算法，オーム社，p.8-219，1986 年.
 #######################
 # 熱交換器の計算に必要なパラメータを取得する
+# 飽和空気の比エンタルピーをtdbにおける接線 hsat ≒ fa * T + fb で近似する
 def getparameter_hex(tdb):
-    delta = 0.001
-    hws1 = tdb2hsat(tdb)
-    hws2 = tdb2hsat(tdb + delta)
-    fa = (hws2 - hws1) / delta
-    fb = hws1 - fa * tdb
+    hws, fa = _tdb2hsat_dhsat(tdb)
+    fb = hws - fa * tdb
     return fa, fb
 
 
-# 熱通過有効度[-]を求める
+# 熱交換器の流れ方向
+# counterflow: 対向流, parallelflow: 並行流, crossflow_both_unmixed: 直交流（両流体非混合、近似式）
+# crossflow_cmax_mixed: 直交流（熱容量流量の大きい側のみ混合）, crossflow_cmin_mixed: 直交流（熱容量流量の小さい側のみ混合）
+# crossflow_both_mixed: 直交流（両流体混合）
+HEX_FLOWTYPES = ('counterflow', 'parallelflow', 'crossflow_both_unmixed', 'crossflow_cmax_mixed',
+                 'crossflow_cmin_mixed', 'crossflow_both_mixed')
+
+
+# 熱通過有効度[-]を求める。ntu, ratio_heat_capは配列でもよい
+# 熱容量流量比ratio_heat_capは1以上の場合は1として扱う
 def hex_effectiveness(ntu, ratio_heat_cap, flowtype):
-    # flowtype : {'counterflow', 'parallelflow'}
-    ratio = ratio_heat_cap
+    # flowtype : HEX_FLOWTYPES参照
+    if flowtype not in HEX_FLOWTYPES:
+        raise ValueError('flowtype must be one of {}: {}'.format(HEX_FLOWTYPES, flowtype))
+    # 配列の場合は配列版で計算する（numpyのスカラーはfloatにして従来どおりfloatを返す）
+    if not (np.ndim(ntu) == 0 and np.ndim(ratio_heat_cap) == 0):
+        return _hex_effectiveness_vec(ntu, ratio_heat_cap, flowtype)
+    ntu = float(ntu)
+    ratio = float(ratio_heat_cap)
 
     if ratio <= 0:
         return 1 - math.exp(-ntu)
@@ -331,21 +1057,474 @@ def hex_effectiveness(ntu, ratio_heat_cap, flowtype):
             return (1 - math.exp(-ntu * (ratio + 1))) / (1 + ratio)
         else:
             return 0.5 * (1 - math.exp(-2 * ntu))
+
+    ratio = min(ratio, 1.0)
+    if flowtype == 'crossflow_both_unmixed':
+        return -math.expm1(ntu ** 0.22 / ratio * math.expm1(-ratio * ntu ** 0.78))
+    elif flowtype == 'crossflow_cmax_mixed':
+        return -math.expm1(ratio * math.expm1(-ntu)) / ratio
+    elif flowtype == 'crossflow_cmin_mixed':
+        return -math.expm1(math.expm1(-ratio * ntu) / ratio)
     else:
-        print('error:flowtype')
+        return 1 / (-1 / math.expm1(-ntu) - ratio / math.expm1(-ratio * ntu) - 1 / ntu)
+
+
+def _hex_effectiveness_vec(ntu, ratio_heat_cap, flowtype):
+    ntu, ratio = np.broadcast_arrays(np.asarray(ntu, dtype=float), np.asarray(ratio_heat_cap, dtype=float))
+    r = np.clip(ratio, 1e-300, 1.0)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        if flowtype == 'counterflow':
+            e = np.exp((r - 1) * ntu)
+            eff = np.where(r < 1, (1 - e) / (1 - r * e), ntu / (1 + ntu))
+        elif flowtype == 'parallelflow':
+            eff = -np.expm1(-ntu * (r + 1)) / (1 + r)
+        elif flowtype == 'crossflow_both_unmixed':
+            eff = -np.expm1(ntu ** 0.22 / r * np.expm1(-r * ntu ** 0.78))
+        elif flowtype == 'crossflow_cmax_mixed':
+            eff = -np.expm1(r * np.expm1(-ntu)) / r
+        elif flowtype == 'crossflow_cmin_mixed':
+            eff = -np.expm1(np.expm1(-r * ntu) / r)
+        else:
+            eff = 1 / (-1 / np.expm1(-ntu) - r / np.expm1(-r * ntu) - 1 / ntu)
+    eff = np.where(ntu == 0, 0.0, eff)
+    return np.where(ratio <= 0, -np.expm1(-ntu), eff)
 
 
 # NTU(熱通過数:Number of transfer unit[-])を求める
-def hex_ntu(feff, fratio_heat_cap, fflowtype):
-    # flowtype : {'counterflow', 'parallelflow'}
-    hex_eff = feff
-    hex_ratio = fratio_heat_cap
-    hex_flowtype = fflowtype
-
-    def hex_efunc(fntu):
-        return hex_eff - hex_effectiveness(fntu, hex_ratio, hex_flowtype)
+# hex_effectivenessの逆関数。eff, ratio_heat_capは配列でもよい
+# counterflow, parallelflow, crossflow_cmax_mixed, crossflow_cmin_mixedは解析解、その他は二分法による。
+# 熱通過有効度がNTU→∞での値に等しい場合はinf、範囲外の場合はValueError
+# crossflow_both_mixedは熱通過有効度がNTUについて極大値をもつため、極大値以下の増加区間の解を返す。
+def hex_ntu(eff, ratio_heat_cap, flowtype):
+    # flowtype : HEX_FLOWTYPES参照
+    if flowtype not in HEX_FLOWTYPES:
+        raise ValueError('flowtype must be one of {}: {}'.format(HEX_FLOWTYPES, flowtype))
+    if flowtype in ('crossflow_both_unmixed', 'crossflow_both_mixed'):
+        ntu = _hex_ntu_bisect(eff, ratio_heat_cap, flowtype)
+        return float(ntu) if ntu.ndim == 0 else ntu
+    if not (isinstance(eff, (int, float)) and isinstance(ratio_heat_cap, (int, float))):
+        return _hex_ntu_vec(eff, ratio_heat_cap, flowtype)
 
-    return optimize.newton(hex_efunc, x0=0, tol=1e-6, maxiter=20)  # rtol=1e-6 fprime=1e-4,
+    ratio = ratio_heat_cap
+    if ratio <= 0:
+        ratio = 0.0
+    elif ratio > 1:
+        ratio = 1.0  # hex_effectivenessでは熱容量流量比1以上を1として扱う
+    if ratio == 0 or flowtype == 'counterflow':
+        eff_max = 1.0
+    elif flowtype == 'parallelflow':
+        eff_max = 1 / (1 + ratio)
+    elif flowtype == 'crossflow_cmax_mixed':
+        eff_max = -math.expm1(-ratio) / ratio
+    else:
+        eff_max = -math.expm1(-1 / ratio)
+    if not 0 <= eff <= eff_max:
+        raise ValueError('eff must be in [0, {}]: {}'.format(eff_max, eff))
+    if eff == eff_max:
+        return math.inf
+
+    if ratio == 0:
+        return -math.log1p(-eff)
+    if flowtype == 'counterflow':
+        if ratio < 1:
+            return (math.log1p(-ratio * eff) - math.log1p(-eff)) / (1 - ratio)
+        else:
+            return eff / (1 - eff)
+    elif flowtype == 'parallelflow':
+        return -math.log1p(-eff * (1 + ratio)) / (1 + ratio)
+    elif flowtype == 'crossflow_cmax_mixed':
+        return -math.log1p(math.log1p(-ratio * eff) / ratio)
+    else:
+        return -math.log1p(ratio * math.log1p(-eff)) / ratio
+
+
+def _hex_ntu_vec(eff, ratio_heat_cap, flowtype):
+    eff, ratio = np.broadcast_arrays(np.asarray(eff, dtype=float), np.asarray(ratio_heat_cap, dtype=float))
+    ratio = np.clip(ratio, 0.0, 1.0)
+    r = np.maximum(ratio, 1e-300)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        if flowtype == 'counterflow':
+            eff_max = np.ones(ratio.shape)
+        elif flowtype == 'parallelflow':
+            eff_max = 1 / (1 + ratio)
+        elif flowtype == 'crossflow_cmax_mixed':
+            eff_max = np.where(ratio > 0, -np.expm1(-r) / r, 1.0)
+        else:
+            eff_max = np.where(ratio > 0, -np.expm1(-1 / r), 1.0)
+        if np.any((eff < 0) | (eff > eff_max)):
+            raise ValueError('eff must be in [0, eff_max]')
+
+        if flowtype == 'counterflow':
+            ntu = np.where(ratio < 1, (np.log1p(-ratio * eff) - np.log1p(-eff)) / (1 - ratio), eff / (1 - eff))
+        elif flowtype == 'parallelflow':
+            ntu = -np.log1p(-eff * (1 + ratio)) / (1 + ratio)
+        elif flowtype == 'crossflow_cmax_mixed':
+            ntu = -np.log1p(np.log1p(-r * eff) / r)
+        else:
+            ntu = -np.log1p(r * np.log1p(-eff)) / r
+        ntu = np.where(ratio > 0, ntu, -np.log1p(-eff))
+    return np.where(eff == eff_max, np.inf, ntu)
+
+
+# 解析解のない流れ方向について、ln(NTU)の区間[ln(1e-12), ln(1e4)]の二分法でNTUを求める
+def _hex_ntu_bisect(eff, ratio_heat_cap, flowtype):
+    eff, ratio = np.broadcast_arrays(np.asarray(eff, dtype=float), np.asarray(ratio_heat_cap, dtype=float))
+    lo = np.full(eff.shape, math.log(1e-12))
+    hi = np.full(eff.shape, math.log(1e4))
+    eff_inf = np.ones(eff.shape)  # NTU→∞での熱通過有効度
+    if flowtype == 'crossflow_both_mixed':
+        # 極大点を三分探索で求め、探索区間を増加区間に限定する
+        a = lo.copy()
+        b = hi.copy()
+        for _ in range(60):
+            m1 = a + (b - a) / 3
+            m2 = b - (b - a) / 3
+            up = _hex_effectiveness_vec(np.exp(m1), ratio, flowtype) < _hex_effectiveness_vec(np.exp(m2), ratio, flowtype)
+            a = np.where(up, m1, a)
+            b = np.where(up, b, m2)
+        hi = np.where(ratio > 0, (a + b) / 2, hi)
+        eff_inf = np.where(ratio > 0, 2.0, 1.0)  # 極大点をもつ場合はinfを返さない
+    eff_max = np.maximum(_hex_effectiveness_vec(np.exp(hi), ratio, flowtype), np.where(eff_inf == 1.0, 1.0, 0.0))
+    if np.any((eff < 0) | (eff > eff_max)):
+        raise ValueError('eff must be in [0, eff_max]')
+
+    for _ in range(60):
+        mid = (lo + hi) / 2
+        below = _hex_effectiveness_vec(np.exp(mid), ratio, flowtype) < eff
+        lo = np.where(below, mid, lo)
+        hi = np.where(below, hi, mid)
+    ntu = np.where(eff == 0, 0.0, np.exp(hi))
+    return np.where(eff == eff_inf, np.inf, ntu)
+
+
+# 空気状態関数等のキャッシュ ###################################################
+# 同一時刻内で同じ入力による変換が繰り返されるため、入力をtolで量子化した値をキーとする上限付きLRUキャッシュを用意する。
+# 計算は量子化後の入力で行うので、結果は入力の誤差が最大tol/2の場合の結果と等しく、入力の到着順にもよらない。
+# enable_psy_cache()でモジュール内の関数を置き換えるため、機器モデル内部からの呼び出しにも適用される。
+class QuantizedLRUCache:
+    def __init__(self, func, tol=0.01, maxsize=4096):
+        if tol <= 0:
+            raise ValueError('tol must be positive: {}'.format(tol))
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1: {}'.format(maxsize))
+        self.func = func
+        self.tol = tol
+        self.maxsize = maxsize
+        self.hits = 0  # キャッシュから返した回数
+        self.misses = 0  # 関数を計算した回数
+        self.evictions = 0  # 上限を超えて破棄した回数
+        self._cache = OrderedDict()
+        self.__name__ = func.__name__
+
+    def __call__(self, *args, **kwargs):
+        # キーワード引数（反復計算の収束判定値など）を指定した場合はキャッシュしない
+        if kwargs:
+            return self.func(*args, **kwargs)
+        key = tuple(round(a / self.tol) for a in args)
+        try:
+            value = self._cache[key]
+        except KeyError:
+            self.misses += 1
+            value = self.func(*(k * self.tol for k in key))
+            self._cache[key] = value
+            if len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+                self.evictions += 1
+        else:
+            self.hits += 1
+            self._cache.move_to_end(key)
+        # リストは呼び出し側で書き換えられてもよいように複製して返す
+        if isinstance(value, list):
+            return list(value)
+        return value
+
+    def clear(self):
+        self._cache.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'size': len(self._cache), 'maxsize': self.maxsize, 'tol': self.tol}
+
+
+# キャッシュ可能な関数（スカラー入力のみ）
+PSY_CACHE_TARGETS = ('tdb_rh2h_x', 'tdb_rh2tdp', 'tdb_rh2twb', 'tdb_rh2h', 'tdb_rh2w', 'tdb2hsat', 'tdb2dhsat',
+                     'tdb2psat', 'tdp2psat', 'getparameter_hex')
+_PSY_CACHE_ORIGINAL = {}
+
+
+# namesの関数をキャッシュ付きに置き換える。tol: 入力の量子化幅（温度[℃]、相対湿度[%]共通）
+def enable_psy_cache(names=('tdb_rh2h_x', 'tdb_rh2twb', 'tdb_rh2tdp', 'getparameter_hex'), tol=0.01, maxsize=4096):
+    for name in names:
+        if name not in PSY_CACHE_TARGETS:
+            raise ValueError('{} is not cacheable: choose from {}'.format(name, PSY_CACHE_TARGETS))
+    disable_psy_cache()
+    for name in names:
+        _PSY_CACHE_ORIGINAL[name] = globals()[name]
+        globals()[name] = QuantizedLRUCache(_PSY_CACHE_ORIGINAL[name], tol=tol, maxsize=maxsize)
+
+
+# キャッシュを解除して元の関数に戻す
+def disable_psy_cache():
+    for name, func in _PSY_CACHE_ORIGINAL.items():
+        globals()[name] = func
+    _PSY_CACHE_ORIGINAL.clear()
+
+
+# 各キャッシュのヒット数、ミス数、破棄数等
+def psy_cache_info():
+    return {name: globals()[name].info() for name in _PSY_CACHE_ORIGINAL}
+
+
+# キャッシュファイルの書き込み（気象データ、機器特性表、VRFの性能曲線、校正値で共通）
+# 同じ場所の一時ファイルに書き込んでからos.replaceで置き換えるため、書き込みに失敗しても既存のファイルは壊れず、
+# 同じファイルを複数のプロセスから読んでも書きかけの内容は見えない。
+# write  :開いたファイルを受け取って内容を書き込む関数
+# kind   :警告に表示するキャッシュの種類
+# binary :Trueの場合はバイナリ、Falseの場合はutf-8のテキストとして開く
+# 戻り値  :書き込めた場合True
+def _write_cache_file(cache_file, write, kind, binary=False):
+    tmp_file = '{}.{}.tmp'.format(cache_file, os.getpid())
+    try:
+        if binary:
+            with open(tmp_file, 'wb') as f:
+                write(f)
+        else:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                write(f)
+        os.replace(tmp_file, cache_file)
+        return True
+    except (OSError, TypeError, ValueError):
+        print('warning: {} cache could not be written: {}'.format(kind, cache_file))
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        return False
+
+
+# 気象データの読み込み #########################################################
+# 外気の乾球温度・相対湿度から、湿球温度等の空気状態を全期間分まとめて計算する。
+# 各機器のcalに計算済みの空気状態を渡すことで、時刻ごとの変換を省略できる（CoolingTower.calのhin, twbin等）。
+# cache=Trueの場合、計算結果をfilenameと同じ場所の"<filename>.weather.npz"に保存し、
+# 入力ファイルの内容・引数・飽和水蒸気圧の計算方法が同じであれば次回以降はそれを読み込む。
+# キャッシュはnumpyの配列のみで保存し、読み込み時にpickleは用いない（文字列の列は文字列として復元される）。
+WEATHER_CACHE_SUFFIX = '.weather.npz'
+WEATHER_CACHE_VERSION = 2  # 空気状態の計算方法を変更した場合は更新する
+
+
+# filename   :気象データのcsvファイル（1列目が時刻）
+# col_tdb    :外気乾球温度['C]の列（列名または列番号）
+# col_rh     :外気相対湿度[%](0~100)の列（列名または列番号）
+# resample   :時間間隔の変更（例：'1min'）。pandasのresampleと同じ指定で、間の値は線形補間する（文字列等の数値でない列は除く）
+# 戻り値      :元の列に tdb, rh, twb['C], w[kg/kg'], h[kJ/kg'], tdp['C], den[kg/m3] を加えたDataFrame
+def read_weather(filename, col_tdb, col_rh, resample=None, cache=False, encoding=None):
+    key = None
+    cache_file = filename + WEATHER_CACHE_SUFFIX
+    if cache:
+        with open(filename, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        key = repr((WEATHER_CACHE_VERSION, digest, col_tdb, col_rh, resample, encoding, PSAT_BACKEND))
+        if os.path.exists(cache_file):
+            try:
+                data = _read_weather_cache(cache_file, key)
+                if data is not None:
+                    return data
+            except Exception:
+                print('warning: weather cache is broken and recalculated: {}'.format(cache_file))
+
+    data = pd.read_csv(filename, index_col=0, parse_dates=True, encoding=encoding)
+    # 列番号は読み込んだ時点の列で列名にする（resampleで数値でない列を除くと列番号がずれるため）
+    col_tdb = col_tdb if col_tdb in data.columns else data.columns[col_tdb]
+    col_rh = col_rh if col_rh in data.columns else data.columns[col_rh]
+    if resample is not None:
+        data = data.resample(resample).mean(numeric_only=True).interpolate()
+
+    tdb = data[col_tdb].to_numpy(dtype=float)
+    rh = data[col_rh].to_numpy(dtype=float)
+    h, w = tdb_rh2h_x_vec(tdb, rh)
+    data['tdb'] = tdb
+    data['rh'] = rh
+    data['twb'] = tdb_rh2twb_vec(tdb, rh)
+    data['w'] = w
+    data['h'] = h
+    data['tdp'] = tdb_rh2tdp_vec(tdb, rh)
+    data['den'] = tdb2den_vec(tdb)
+
+    if cache:
+        _write_weather_cache(cache_file, key, data)
+    return data
+
+
+def _weather_cache_array(values):
+    values = np.asarray(values)
+    if values.dtype == object:
+        values = values.astype(str)
+    return values
+
+
+def _write_weather_cache(cache_file, key, data):
+    arrays = {'col_{}'.format(i): _weather_cache_array(data.iloc[:, i].to_numpy()) for i in range(data.shape[1])}
+    meta = {'key': key, 'columns': [str(c) for c in data.columns], 'index_name': data.index.name,
+            'freq': getattr(data.index, 'freqstr', None)}
+    index = _weather_cache_array(data.index.to_numpy())
+    _write_cache_file(cache_file, lambda f: np.savez(f, meta=np.array(json.dumps(meta)), index=index, **arrays),
+                      'weather', binary=True)
+
+
+# キャッシュの読み込み（keyが異なる場合はNone）
+def _read_weather_cache(cache_file, key):
+    with np.load(cache_file, allow_pickle=False) as stored:
+        meta = json.loads(str(stored['meta']))
+        if meta['key'] != key:
+            return None
+        index = stored['index']
+        if np.issubdtype(index.dtype, np.datetime64):
+            index = pd.DatetimeIndex(index, name=meta['index_name'], freq=meta['freq'])
+        else:
+            index = pd.Index(index, name=meta['index_name'])
+        return pd.DataFrame({c: stored['col_{}'.format(i)] for i, c in enumerate(meta['columns'])}, index=index)
+
+
+# 機器特性表（equipment_spec.xlsx）の読み込み ####################################
+# ブックの全シートを一度だけ読み込み、プロセス内で使い回す（同じファイルを機器ごと・時刻ごとに読み直さない）。
+# 回帰分析用のデータセット（1行目が見出し、2行目以降が数値）のシートは、見出しを列名とした数値(float64)の表にする。
+# それ以外のシート（Chiller等の機器特性表、入力シート）は位置で参照するため、header=Noneの表のままとする。
+# cache=Trueの場合、読み込んだ表をfilenameと同じ場所の"<filename>.spec.json"に保存し、
+# ブックの内容が同じであれば次回以降はそれを読み込む（read_excelよりも速い）。
+SPEC_CACHE_SUFFIX = '.spec.json'
+SPEC_CACHE_VERSION = 2  # 保存形式を変更した場合は更新する
+_SPEC_REGISTRY = {}
+
+
+# filename   :機器特性表のxlsxファイル
+# 戻り値      :{シート名: DataFrame} の辞書
+def load_equipment_spec(filename='equipment_spec.xlsx', cache=False):
+    stat = os.stat(filename)
+    reg_key = (os.path.abspath(filename), stat.st_mtime_ns, stat.st_size)
+    if reg_key in _SPEC_REGISTRY:
+        return _SPEC_REGISTRY[reg_key]
+
+    raw = None
+    key = None
+    cache_file = filename + SPEC_CACHE_SUFFIX
+    if cache:
+        with open(filename, 'rb') as f:
+            key = repr((SPEC_CACHE_VERSION, hashlib.sha256(f.read()).hexdigest()))
+        if os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    stored = json.load(f)
+                if stored['key'] == key:
+                    raw = {name: pd.DataFrame([[np.nan if v is None else v for v in row] for row in rows])
+                           for name, rows in stored['sheets'].items()}
+            except (OSError, ValueError, KeyError):
+                print('warning: spec cache is broken and reloaded: {}'.format(cache_file))
+
+    if raw is None:
+        raw = pd.read_excel(filename, sheet_name=None, header=None)
+        if cache:
+            sheets = {name: [[None if pd.isna(v) else v for v in row] for row in table.values.tolist()]
+                      for name, table in raw.items()}
+            _write_cache_file(cache_file, lambda f: json.dump({'key': key, 'sheets': sheets}, f, ensure_ascii=False),
+                              'spec')
+
+    spec = {name: _parse_spec_sheet(table) for name, table in raw.items()}
+    _SPEC_REGISTRY[reg_key] = spec
+    return spec
+
+
+# データセットのシートを見出しを列名とした数値の表にする（データセットでない場合はそのまま返す）
+def _parse_spec_sheet(table):
+    if len(table) < 2:
+        return table
+    header = table.iloc[0]
+    if header.isna().all() or not all(isinstance(v, str) for v in header if not pd.isna(v)):
+        return table
+    try:
+        data = table.iloc[1:].astype('float64')
+    except (ValueError, TypeError):
+        return table
+    data.columns = [v if isinstance(v, str) else i for i, v in enumerate(header)]
+    data.attrs['layout'] = 'dataset'
+    return data
+
+
+# 1シート分の機器特性表を返す。specにload_equipment_specの戻り値を渡した場合はファイルを読まない。
+def get_spec_sheet(sheet_name, filename='equipment_spec.xlsx', spec=None):
+    if spec is None:
+        spec = load_equipment_spec(filename)
+    if sheet_name not in spec:
+        raise ValueError('sheet "{}" is not found in the equipment spec'.format(sheet_name))
+    return spec[sheet_name].copy()
+
+
+# 回帰分析用のデータセット（見出しを列名とした数値の表）
+def _spec_dataset(sheet_name, filename='equipment_spec.xlsx', spec=None, dropna=False):
+    data = get_spec_sheet(sheet_name, filename, spec)
+    if data.attrs.get('layout') != 'dataset':
+        raise ValueError('sheet "{}" is not a numeric dataset with a header row'.format(sheet_name))
+    if dropna:
+        data = data.dropna(how='all', axis=1)
+    return data
+
+
+# 機器の定格値からの校正値（CoolingTowerのUA、HeatExchangerW2Aの伝熱面積等）のキャッシュ ######################
+# 同じ定格値の機器を何度も作る場合に、構築時の収束計算を省略する。プロセス内では常に保存し、
+# set_calibration_cacheでjsonファイルを指定した場合はファイルにも保存する（次回以降のプロセスでも用いる）。
+_CALIBRATION_CACHE = {}
+_CALIBRATION_CACHE_FILE = None
+
+
+# filename :校正値を保存するjsonファイル（Noneの場合はファイルに保存しない）
+def set_calibration_cache(filename=None):
+    global _CALIBRATION_CACHE_FILE
+    _CALIBRATION_CACHE_FILE = filename
+    if filename is not None:
+        _calibration_load(filename)
+
+
+def clear_calibration_cache():
+    _CALIBRATION_CACHE.clear()
+
+
+# ファイルの校正値をプロセス内のキャッシュに加える
+def _calibration_load(filename):
+    if not os.path.exists(filename):
+        return
+    try:
+        with open(filename, 'r') as f:
+            stored = json.load(f)
+        for kind, values in stored.items():
+            _CALIBRATION_CACHE.setdefault(kind, {}).update(values)
+    except (OSError, ValueError, AttributeError):
+        print('warning: calibration cache is broken and ignored: {}'.format(filename))
+
+
+# 定格値のタプルを文字列のキーにする（numpyの数値もfloatとして扱い、型によらず同じキーにする）
+def _calibration_key(design):
+    return repr(tuple(float(v) if isinstance(v, (int, float, np.number)) and not isinstance(v, bool) else v
+                      for v in design))
+
+
+# kind :機器の種類（クラス名）、design :校正値を決める定格値のタプル
+def _calibration_get(kind, design):
+    return _CALIBRATION_CACHE.get(kind, {}).get(_calibration_key(design))
+
+
+# value :校正値（数値、または{属性名: 数値}の辞書）。jsonに保存できるようfloatにする
+def _calibration_put(kind, design, value):
+    if isinstance(value, dict):
+        value = {name: float(v) for name, v in value.items()}
+    else:
+        value = float(value)
+    if _CALIBRATION_CACHE_FILE is not None:
+        # 同じファイルを用いる他のプロセスが書き込んだ校正値を消さないよう、書き込む直前に読み直して加える
+        _calibration_load(_CALIBRATION_CACHE_FILE)
+    _CALIBRATION_CACHE.setdefault(kind, {})[_calibration_key(design)] = value
+    if _CALIBRATION_CACHE_FILE is not None:
+        _write_cache_file(_CALIBRATION_CACHE_FILE, lambda f: json.dump(_CALIBRATION_CACHE, f, indent=1), 'calibration')
+    return value
 
 
 # 機器関係モデル ###############################################################
@@ -358,22 +1537,62 @@ class Valve:
         # vlv       :バルブ開度(1:全開,0:全閉)
         # dp        :バルブによる圧力損失[kPa]
         # g         ：流量 単位要確認!!
-        self.cv_max = cv_max
-        self.r = r
+        # co        :圧力損失の係数 dp = co * g^2。vlv, cv_max, rが変わったときのみ計算し直す
+        self._cv_max = cv_max
+        self._r = r
+        self._vlv = 0.0
+        self._co = None
         self.dp = 0.0
-        self.vlv = 0.0
         self.g = 0.0
 
+    @property
+    def vlv(self):
+        return self._vlv
+
+    @vlv.setter
+    def vlv(self, vlv):
+        if vlv != self._vlv:
+            self._vlv = vlv
+            self._co = None
+
+    @property
+    def cv_max(self):
+        return self._cv_max
+
+    @cv_max.setter
+    def cv_max(self, cv_max):
+        if cv_max != self._cv_max:
+            self._cv_max = cv_max
+            self._co = None
+
+    @property
+    def r(self):
+        return self._r
+
+    @r.setter
+    def r(self, r):
+        if r != self._r:
+            self._r = r
+            self._co = None
+
+    @property
+    def co(self):
+        if self._co is None:
+            # cv = self.cv_max * self.r**(self.vlv - 1)
+            # self.dp = - 1743 * (self.g * 1000 / 60)**2 / cv**2 イコールパーセント特性
+            cv2 = (self._cv_max * self._r ** (self._vlv - 1)) ** 2
+            if cv2 > 0:
+                self._co = - 1743 * (1000 / 60) ** 2 / cv2
+            else:
+                self._co = 0.0
+        return self._co
+
     def f2p(self, g):  # flow to pressure
         self.g = g
-        # cv = self.cv_max * self.r**(self.vlv - 1)
-        # self.dp = - 1743 * (self.g * 1000 / 60)**2 / cv**2 イコールパーセント特性
-        if self.vlv == 0.0:
+        if self._vlv == 0.0:
             self.dp = -99999999
-        elif (self.cv_max * self.r ** (self.vlv - 1)) ** 2 > 0:
-            self.dp = (- 1743 * (1000 / 60) ** 2 / (self.cv_max * self.r ** (self.vlv - 1)) ** 2) * self.g ** 2
         else:
-            self.dp = 0.0
+            self.dp = self.co * self.g ** 2
 
         if self.g < 0:
             self.dp = -self.dp
@@ -381,27 +1600,224 @@ class Valve:
 
     def p2f(self, dp):
         self.dp = dp
-        if self.vlv == 0.0:
+        if self._vlv == 0.0:
             self.g = 0
         elif self.dp < 0:
-            self.g = (self.dp / ((- 1743 * (1000 / 60) ** 2 / (self.cv_max * self.r ** (self.vlv - 1)) ** 2))) ** 0.5
+            self.g = (self.dp / self.co) ** 0.5
         else:
-            self.g = - (self.dp / (
-            (1743 * (1000 / 60) ** 2 / (self.cv_max * self.r ** (self.vlv - 1)) ** 2))) ** 0.5  # 逆流
+            self.g = - (self.dp / -self.co) ** 0.5  # 逆流
 
         return self.g
 
     def f2p_co(self):  # coefficient for f2p
-        if self.vlv == 0.0:
+        if self._vlv == 0.0:
             return np.array([0, 0, -99999999])
         else:
-            return np.array([0, 0, (- 1743 * (1000 / 60) ** 2 / (self.cv_max * self.r ** (self.vlv - 1)) ** 2)])
+            return np.array([0, 0, self.co])
+
+
+# 複数のバルブをまとめて計算する（各値はN個の配列）
+# bank[i]はValveと同じように使えるi番目のバルブで、値はbankの配列と共有する
+class ValveBank:
+    def __init__(self, cv_max=800, r=100, n=None):
+        # cv_max    :流量係数（スカラーまたは長さNの配列）
+        # r         :レンジアビリティ（スカラーまたは長さNの配列）
+        # n         :バルブの数（cv_max, rがスカラーの場合に指定）
+        # vlv       :バルブ開度(1:全開,0:全閉)
+        # dp        :バルブによる圧力損失[kPa]
+        # g         ：流量
+        if n is None:
+            n = np.broadcast(np.asarray(cv_max), np.asarray(r)).size
+        self._cv_max = np.array(np.broadcast_to(cv_max, (n,)), dtype=float)
+        self._r = np.array(np.broadcast_to(r, (n,)), dtype=float)
+        self._vlv = np.zeros(n)
+        self.dp = np.zeros(n)
+        self.g = np.zeros(n)
+
+    # vlv, cv_max, rへの代入は配列の中身を書き換える（スカラーの場合は全バルブに同じ値を設定する）
+    @property
+    def vlv(self):
+        return self._vlv
+
+    @vlv.setter
+    def vlv(self, value):
+        self._vlv[:] = value
+
+    @property
+    def cv_max(self):
+        return self._cv_max
+
+    @cv_max.setter
+    def cv_max(self, value):
+        self._cv_max[:] = value
+
+    @property
+    def r(self):
+        return self._r
+
+    @r.setter
+    def r(self, value):
+        self._r[:] = value
+
+    def __len__(self):
+        return len(self._vlv)
+
+    def __getitem__(self, i):
+        if not -len(self) <= i < len(self):
+            raise IndexError('valve index out of range: {}'.format(i))
+        return _ValveBankView(self, i % len(self))
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    # 圧力損失の係数 dp = co * g^2（全閉のバルブは-99999999）
+    @property
+    def co(self):
+        with np.errstate(divide='ignore', over='ignore'):
+            cv2 = (self.cv_max * self.r ** (self.vlv - 1)) ** 2
+            co = np.where(cv2 > 0, - 1743 * (1000 / 60) ** 2 / cv2, 0.0)
+        return np.where(self.vlv == 0.0, -99999999.0, co)
+
+    def f2p(self, g):  # flow to pressure
+        self.g = np.array(np.broadcast_to(g, self.vlv.shape), dtype=float)
+        co = self.co
+        self.dp = np.where(self.vlv == 0.0, co, co * self.g ** 2)
+        self.dp = np.where(self.g < 0, -self.dp, self.dp)
+        return self.dp
+
+    def p2f(self, dp):
+        self.dp = np.array(np.broadcast_to(dp, self.vlv.shape), dtype=float)
+        co = self.co
+        with np.errstate(invalid='ignore', divide='ignore'):
+            g = np.where(self.dp < 0, (self.dp / co) ** 0.5, - (self.dp / -co) ** 0.5)  # 逆流
+        self.g = np.where(self.vlv == 0.0, 0.0, g)
+        return self.g
+
+    def f2p_co(self):  # coefficient for f2p（N×3の配列）
+        co = np.zeros((len(self), 3))
+        co[:, 2] = self.co
+        return co
+
+
+# ValveBankのi番目のバルブ
+class _ValveBankView(Valve):
+    def __init__(self, bank, i):
+        self._bank = bank
+        self._i = i
+
+    def _get(self, name):
+        return float(getattr(self._bank, name)[self._i])
+
+    def _set(self, name, value):
+        getattr(self._bank, name)[self._i] = value
+
+    vlv = property(lambda self: self._get('vlv'), lambda self, value: self._set('vlv', value))
+    _vlv = property(lambda self: self._get('vlv'))
+    cv_max = property(lambda self: self._get('cv_max'), lambda self, value: self._set('cv_max', value))
+    r = property(lambda self: self._get('r'), lambda self, value: self._set('r', value))
+    g = property(lambda self: self._get('g'), lambda self, value: self._set('g', value))
+    dp = property(lambda self: self._get('dp'), lambda self, value: self._set('dp', value))
+
+    @property
+    def co(self):
+        cv2 = (self.cv_max * self.r ** (self.vlv - 1)) ** 2
+        if cv2 > 0:
+            return - 1743 * (1000 / 60) ** 2 / cv2
+        else:
+            return 0.0
+
+
+# インスタンス名の取得（Pump, Fanのfigure=1の場合のみ使用）。'__init__'から直接呼び出すこと
+def _instance_name():
+    (filename, line_number, function_name, text) = traceback.extract_stack()[-3]
+    return text[:text.find('=')].strip()
+
+
+# ポンプ・ファンの性能曲線（圧力-流量、効率-流量）をaxに描く
+def _plot_curve(ax, equipment, x, y_p, ylabel):
+    x2 = np.linspace(0, equipment.g_d * equipment.inv, 50)
+    k = (1.0 - (1.0 - equipment.r_ef) / (equipment.inv ** 0.2)) / equipment.r_ef
+    eg = equipment.eg
+    y_e = k * (eg[0] + eg[1] * (x2/equipment.inv) + eg[2] * (x2/equipment.inv) ** 2)
+    color1 = 'tab:orange'
+    ax.set_xlabel('Flow [m3/min]')
+    ax.set_ylabel(ylabel, color=color1)
+    ax.plot(x, y_p, color=color1)
+    ax.tick_params(axis='y', labelcolor=color1)
+    ax.set_ylim(0, equipment.pg[0] + 10)
+
+    ax2 = ax.twinx()
+    color2 = 'tab:blue'
+    ax2.set_ylabel('Efficiency [-]', color=color2)
+    ax2.plot(x2, y_e, color=color2)
+    ax2.tick_params(axis='y', labelcolor=color2)
+    ax2.set_ylim(0, 1)
+    ax.set_title('{}'.format(equipment.name if equipment.name is not None else type(equipment).__name__))
+
+
+# 複数のポンプ・ファンの性能曲線を画面に表示せずにファイルに保存する
+# equipments :plot_curveをもつ機器のリスト、または{ファイル名: 機器}の辞書
+# dirname    :保存先のフォルダ
+# fmt        :画像の形式（'png', 'pdf', 'svg'等）
+# 戻り値      :保存したファイルのパスのリスト
+def save_curve_figures(equipments, dirname='.', fmt='png', dpi=100):
+    from matplotlib.figure import Figure
+    if not isinstance(equipments, dict):
+        equipments = {(e.name if e.name is not None else '{}{}'.format(type(e).__name__, i)): e
+                      for i, e in enumerate(equipments)}
+    os.makedirs(dirname, exist_ok=True)
+    paths = []
+    for name, equipment in equipments.items():
+        fig = Figure()
+        ax = fig.subplots()
+        equipment.plot_curve(ax)
+        fig.tight_layout()
+        path = os.path.join(dirname, '{}.{}'.format(name, fmt))
+        fig.savefig(path, format=fmt, dpi=dpi)
+        paths.append(path)
+    return paths
+
+
+# ポンプの揚程・効率・消費電力を時系列の配列でまとめて計算する（Pump.calと同じ計算）
+# g      :流量[m3/min]の配列
+# inv    :回転数比(0.0~1.0)の配列（スカラーでもよい）
+# pg, eg, r_ef :Pumpと同じ
+# 戻り値  :揚程dp[kPa], 効率ef, 消費電力pw[kW], flagの配列。流量または回転数比が0の時刻はdp, ef, pw, flagとも0
+def pump_power(g, inv, pg, eg, r_ef):
+    g, inv = np.broadcast_arrays(np.asarray(g, dtype=float), np.asarray(inv, dtype=float))
+    run = (g > 0) & (inv > 0)
+    inv_run = np.where(run, inv, 1.0)
+    # G: INV=1.0時（定格）の流量, k: 効率換算係数
+    g_rated = g / inv_run
+    k = (1.0 - (1.0 - r_ef) / (inv_run ** 0.2)) / r_ef
+    ef = k * (eg[0] + eg[1] * g_rated + eg[2] * g_rated ** 2)
+    dp = np.maximum((pg[0] + pg[1] * g_rated + pg[2] * g_rated ** 2) * inv_run ** 2, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pw = np.where(ef > 0, 1.0 * g * dp / (60 * ef), 0.0)
+    flag = np.where(ef > 0, 0, 2)
+    return np.where(run, dp, 0.0), np.where(run, ef, 0.0), np.where(run, pw, 0.0), np.where(run, flag, 0)
+
+
+# ファンの静圧・効率・消費電力を時系列の配列でまとめて計算する（Fan.calと同じ計算）
+# 引数・戻り値はpump_powerと同じ。静圧dpの単位は[Pa]
+def fan_power(g, inv, pg, eg, r_ef):
+    g, inv = np.broadcast_arrays(np.asarray(g, dtype=float), np.asarray(inv, dtype=float))
+    run = (g > 0) & (inv > 0)
+    inv_run = np.where(run, inv, 1.0)
+    g_rated = g / inv_run
+    k = (1.0 - (1.0 - r_ef) / (inv_run ** 0.2)) / r_ef
+    ef = k * (eg[0] + eg[1] * g_rated + eg[2] * g_rated ** 2)
+    dp = np.maximum((pg[0] + pg[1] * g_rated + pg[2] * g_rated ** 2 + pg[3] * g_rated ** 3) * inv_run ** 2, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pw = np.where(ef > 0, g * (dp / 1000) / (60 * 0.8 * ef), 0.0)
+    flag = np.where(ef > 0, 0, 2)
+    return np.where(run, dp, 0.0), np.where(run, ef, 0.0), np.where(run, pw, 0.0), np.where(run, flag, 0)
 
 
 # ポンプ特性と消費電力計算
 class Pump:
     # 定格値の入力
-    def __init__(self, pg=None, eg=None, r_ef=0.8, g_d=0.25, inv=1.0, figure=1):
+    def __init__(self, pg=None, eg=None, r_ef=0.8, g_d=0.25, inv=1.0, figure=0, name=None):
         # pg     :圧力-流量(pg)曲線の係数（切片、一次、二次）
         # eg     :効率-流量(eg)曲線の係数（切片、一次、二次）
         # r_ef   :定格時の最高効率(本来は計算によって求める？)rated efficiency
@@ -414,10 +1830,12 @@ class Pump:
         # ef     :効率(0.0~1.0)
         # g_d    :定格流量
         # para   :並列ポンプか否かのフラグ
-        # figure :1だったらポンプの性能曲線を表示する、1でなかったら表示しない
+        # figure :1だったらポンプの性能曲線を表示する、1でなかったら表示しない（性能曲線の保存はsave_curve_figures参照）
+        # name   :機器名（グラフのタイトル等に用いる）
 
-        (filename, line_number, function_name, text) = traceback.extract_stack()[-2]
-        self.name = text[:text.find('=')].strip()  # インスタンス名の取得、'__init__'の最初でなければならない
+        self.name = name
+        if name is None and figure == 1:
+            self.name = _instance_name()  # 従来どおり、figure=1の場合はインスタンス名を機器名とする
         if pg is None:
             self.pg = [233, 5.9578, -4.95]
         else:
@@ -490,38 +1908,78 @@ class Pump:
             self.ef = 0.0
             self.flag = 0
 
+    # 流量g、回転数比invの配列に対する揚程・効率・消費電力・flag（pump_power参照）
+    def cal_array(self, g, inv):
+        return pump_power(g, inv, self.pg, self.eg, self.r_ef)
+
     def figure_curve(self):
-        x_max, _ = quadratic_formula(self.pg[0], self.pg[1], self.pg[2])
-        x = np.linspace(0, self.g_d, 50)
-        y_p = (self.pg[0] + self.pg[1] * (x/self.inv) + self.pg[2] * (x/self.inv) ** 2) * self.inv ** 2
-        x2_max, _ = quadratic_formula(self.pg[0] * self.inv ** 2, self.pg[1] * self.inv, self.pg[2])
-        # x2 = np.linspace(0, min(self.g_d, x2_max, self.g_d*self.inv), 50)
-        x2 = np.linspace(0, self.g_d * self.inv, 50)
-        k = (1.0 - (1.0 - self.r_ef) / (self.inv ** 0.2)) / self.r_ef
-        y_e = k * (self.eg[0] + self.eg[1] * (x2/self.inv) + self.eg[2] * (x2/self.inv) ** 2)
+        import matplotlib.pyplot as plt
         fig, ax1 = plt.subplots()
-        color1 = 'tab:orange'
-        ax1.set_xlabel('Flow [m3/min]')
-        ax1.set_ylabel('Pressure [kPa]', color=color1)
-        ax1.plot(x, y_p, color=color1)
-        ax1.tick_params(axis='y', labelcolor=color1)
-        ax1.set_ylim(0, self.pg[0] + 10)
-
-        ax2 = ax1.twinx()
-        color2 = 'tab:blue'
-        ax2.set_ylabel('Efficiency [-]', color=color2)
-        ax2.plot(x2, y_e, color=color2)
-        ax2.tick_params(axis='y', labelcolor=color2)
-        ax2.set_ylim(0, 1)
-        plt.title('{}'.format(self.name))
-
+        self.plot_curve(ax1)
         return plt.show()
 
+    # 性能曲線（揚程・効率）をaxに描く
+    def plot_curve(self, ax):
+        x = np.linspace(0, self.g_d, 50)
+        y_p = (self.pg[0] + self.pg[1] * (x/self.inv) + self.pg[2] * (x/self.inv) ** 2) * self.inv ** 2
+        _plot_curve(ax, self, x, y_p, 'Pressure [kPa]')
+
+
+# 機器特性表の双線形補間（Chiller, AirSourceHeatPump等で使用）
+# 従来のscipy.interpolate.RegularGridInterpolator（線形、範囲外はValueError）と同じ計算を、表を一度だけ読み込んで行う。
+# x, yはスカラーまたは配列
+class _BilinearTable:
+    def __init__(self, x, y, z):
+        # x, y  :軸（昇順）
+        # z     :値の表（len(x)×len(y)）
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.z = np.asarray(z, dtype=float)
+        self._x = self.x.tolist()
+        self._y = self.y.tolist()
+        self._z = self.z.tolist()
+
+    def __call__(self, x, y):
+        if isinstance(x, (int, float)) and isinstance(y, (int, float)):
+            return self._scalar(x, y)
+        x, y = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+        if np.any((x < self.x[0]) | (x > self.x[-1]) | (y < self.y[0]) | (y > self.y[-1])):
+            raise ValueError('One of the requested xi is out of bounds')
+        i = np.clip(np.searchsorted(self.x, x, side='right') - 1, 0, len(self.x) - 2)
+        j = np.clip(np.searchsorted(self.y, y, side='right') - 1, 0, len(self.y) - 2)
+        tx = (x - self.x[i]) / (self.x[i + 1] - self.x[i])
+        ty = (y - self.y[j]) / (self.y[j + 1] - self.y[j])
+        z = self.z
+        return (z[i, j] * (1 - tx) * (1 - ty) + z[i + 1, j] * tx * (1 - ty) + z[i, j + 1] * (1 - tx) * ty +
+                z[i + 1, j + 1] * tx * ty)
+
+    def _scalar(self, x, y):
+        xs = self._x
+        ys = self._y
+        if not (xs[0] <= x <= xs[-1] and ys[0] <= y <= ys[-1]):
+            raise ValueError('One of the requested xi is out of bounds')
+        i = min(max(bisect.bisect_right(xs, x) - 1, 0), len(xs) - 2)
+        j = min(max(bisect.bisect_right(ys, y) - 1, 0), len(ys) - 2)
+        tx = (x - xs[i]) / (xs[i + 1] - xs[i])
+        ty = (y - ys[j]) / (ys[j + 1] - ys[j])
+        z0 = self._z[i]
+        z1 = self._z[i + 1]
+        return (z0[j] * (1 - tx) * (1 - ty) + z1[j] * tx * (1 - ty) + z0[j + 1] * (1 - tx) * ty +
+                z1[j + 1] * tx * ty)
+
+
+# 機器特性表（1行目が負荷率、1列目が温度）から補間表を作る。従来どおりfloat32に丸めた値を用いる
+def _pl_cop_table(data):
+    pl = data[0][1:].astype(np.float32)
+    temp = data.transpose()[0][1:].astype(np.float32)
+    dataset = data[1:].transpose()[1:].transpose().astype(np.float32)
+    return pl, temp, _BilinearTable(temp, pl, dataset)
+
 
 # 負荷率-COP曲線に基づく冷凍機COP計算。表は左から右、上から下に負荷率や冷却水入口温度が上昇しなければならない。
 class Chiller:
     # 定格値の入力
-    def __init__(self, filename='equipment_spec.xlsx', sheet_name='Chiller'):
+    def __init__(self, filename='equipment_spec.xlsx', sheet_name='Chiller', spec_table=None, spec=None):
         # tin   :入口温度[℃]
         # tout  :出口温度[℃]
         # g     :流量[m3/min]
@@ -534,7 +1992,10 @@ class Chiller:
         # kr_ch :蒸発器圧力損失係数[kPa/(m3/min)**2]
         # kr_cd :凝縮器圧力損失係数[kPa/(m3/min)**2]
         # dp    :機器による圧力損失[kPa]
-        spec_table = pd.read_excel(filename, sheet_name=sheet_name, header=None)
+        # spec_table:機器特性表(DataFrame, header=None)。Noneの場合はfilenameのsheet_nameを読み込む
+        # spec      :load_equipment_specの戻り値。複数台で同じブックを使う場合に渡すと読み込みを省略できる
+        if spec_table is None:
+            spec_table = get_spec_sheet(sheet_name, filename, spec)
         self.tout_ch_d = float(spec_table.iat[1, 0])
         self.tin_ch_d = float(spec_table.iat[1, 1])
         self.g_ch_d = float(spec_table.iat[1, 2])
@@ -571,6 +2032,8 @@ class Chiller:
         pl_cop.iat[0, 0] = '-'
         pl_cop = pl_cop.dropna(how='all', axis=1)
         self.data = pl_cop.values
+        # 負荷率・温度の軸とCOPの補間表（calで毎回作らないよう、ここで一度だけ作る）
+        self.pl_axis, self.temp_axis, self.cop_table = _pl_cop_table(self.data)
 
     # 機器特性表に基づく冷凍機COPの算出
     def cal(self, tout_ch_sp, tin_ch, g_ch, tin_cd, g_cd):
@@ -587,10 +2050,8 @@ class Chiller:
 
         if self.q_ch > 0 and self.g_cd > 0:
 
-            pl = self.data[0][1:].astype(np.float32)
-            temp = self.data.transpose()[0][1:].astype(np.float32)
-            dataset = self.data[1:].transpose()[1:].transpose().astype(np.float32)
-            cop = RegularGridInterpolator((temp, pl), dataset)
+            pl = self.pl_axis
+            temp = self.temp_axis
 
             # 部分負荷率
             self.pl = self.q_ch / self.q_ch_d
@@ -615,7 +2076,7 @@ class Chiller:
                 tin_cd_cop = temp[-1]
                 self.flag = 4
 
-            self.cop = float(cop([[tin_cd_cop, pl_cop]]))
+            self.cop = self.cop_table(float(tin_cd_cop), float(pl_cop))
             self.pw = self.q_ch / self.cop + self.pw_sub
             self.tout_cd = (self.q_ch + self.pw) / (4.186 * self.g_cd * 1000 / 60) + self.tin_cd
 
@@ -635,12 +2096,52 @@ class Chiller:
         self.dp_ch = -self.kr_ch * g_ch ** 2
         self.dp_cd = -self.kr_cd * g_cd ** 2
 
+    # calと同じ計算を時系列の配列でまとめて行う（機器の状態（self.tout_ch等）は更新しない）
+    # 引数はcalと同じ（配列またはスカラー）
+    # 戻り値  :q_ch, pl, cop, pw, tout_ch, tout_cd, dp_ch, dp_cd, flagの配列の辞書
+    #          運転しない時刻（q_ch<=0またはg_cd<=0）のtout_cdはtin_cdとする
+    def cal_array(self, tout_ch_sp, tin_ch, g_ch, tin_cd, g_cd):
+        tout_ch_sp, tin_ch, g_ch, tin_cd, g_cd = np.broadcast_arrays(
+            *[np.asarray(v, dtype=float) for v in (tout_ch_sp, tin_ch, g_ch, tin_cd, g_cd)])
+        pl_axis = self.pl_axis
+        temp = self.temp_axis
+        tout_ch = tout_ch_sp.copy()
+        q_ch = (tin_ch - tout_ch) * g_ch * 1000 * 4.186 / 60
+        run = (q_ch > 0) & (g_cd > 0)
+        flag = np.where(run, 0, np.where(q_ch == 0, 0, 5))
+
+        # 部分負荷率（定格を超える場合は定格能力で頭打ちにし、冷水出口温度が上がる）
+        pl = np.where(run, q_ch / self.q_ch_d, 0.0)
+        over = run & (pl > pl_axis[-1])
+        under = run & (pl < pl_axis[0])
+        g_run = np.where(over, g_ch, 1.0)
+        tout_ch = np.where(over, tout_ch + (q_ch - self.q_ch_d) / (g_run * 1000 * 4.186 / 60), tout_ch)
+        q_ch = np.where(over, self.q_ch_d, q_ch)
+        pl = np.where(over, pl_axis[-1], pl)
+        pl_cop = np.where(over | under, pl_axis[-1], pl)
+        flag = np.where(over, 1, np.where(under, 2, flag))
+
+        tin_cd_cop = tin_cd - (tout_ch - self.tout_ch_d)  # 冷水出口温度に関する補正
+        low = run & (tin_cd_cop < temp[0])
+        high = run & (tin_cd_cop > temp[-1])
+        tin_cd_cop = np.clip(tin_cd_cop, temp[0], temp[-1])
+        flag = np.where(low, 3, np.where(high, 4, flag))
+
+        cop = np.zeros_like(q_ch)
+        cop[run] = self.cop_table(tin_cd_cop[run], pl_cop[run])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pw = np.where(run, q_ch / cop + self.pw_sub, 0.0)
+            tout_cd = np.where(run, (q_ch + pw) / (4.186 * g_cd * 1000 / 60) + tin_cd, tin_cd)
+
+        return {'q_ch': q_ch, 'pl': pl, 'cop': cop, 'pw': pw, 'tout_ch': tout_ch, 'tout_cd': tout_cd,
+                'dp_ch': -self.kr_ch * g_ch ** 2, 'dp_cd': -self.kr_cd * g_cd ** 2, 'flag': flag}
+
 
 # 負荷率-COP曲線に基づく空冷HPのCOP計算。表は左から右、上から下に負荷率や冷却水入口温度が上昇しなければならない。
 # https://salamann.com/python-multi-dimension-data-interpolation
 class AirSourceHeatPump:
     # 定格値の入力
-    def __init__(self, filename='equipment_spec.xlsx', sheet_name='AirSourceHeatPump'):
+    def __init__(self, filename='equipment_spec.xlsx', sheet_name='AirSourceHeatPump', spec_table=None, spec=None):
         # tin   :入口温度[℃]
         # tout  :出口温度[℃]
         # g     :流量[m3/min]
@@ -652,7 +2153,10 @@ class AirSourceHeatPump:
         # kr_ch :冷水圧力損失係数[kPa/(m3/min)**2]
         # dp    :機器による圧力損失[kPa]
         # tdb   :外気乾球温度['C]
-        spec_table = pd.read_excel(filename, sheet_name=sheet_name, header=None)
+        # spec_table:機器特性表(DataFrame, header=None)。Noneの場合はfilenameのsheet_nameを読み込む
+        # spec      :load_equipment_specの戻り値。複数台で同じブックを使う場合に渡すと読み込みを省略できる
+        if spec_table is None:
+            spec_table = get_spec_sheet(sheet_name, filename, spec)
         self.tout_ch_d = float(spec_table.iat[1, 0])
         self.tin_ch_d = float(spec_table.iat[1, 1])
         self.g_ch_d = float(spec_table.iat[1, 2])
@@ -684,6 +2188,8 @@ class AirSourceHeatPump:
         pl_cop.iat[0, 0] = '-'
         pl_cop = pl_cop.dropna(how='all', axis=1)
         self.data = pl_cop.values
+        # 負荷率・温度の軸とCOPの補間表（calで毎回作らないよう、ここで一度だけ作る）
+        self.pl_axis, self.temp_axis, self.cop_table = _pl_cop_table(self.data)
 
     # 機器特性表に基づく空冷HPのCOPの算出
     def cal(self, tout_ch_sp, tin_ch, g_ch, tdb):
@@ -703,10 +2209,7 @@ class AirSourceHeatPump:
             self.flag = 1
 
         if self.q_ch > 0:
-            pl = self.data[0][1:].astype(np.float32)
-            temp = self.data.transpose()[0][1:].astype(np.float32)
-            dataset = self.data[1:].transpose()[1:].transpose().astype(np.float32)
-            cop = RegularGridInterpolator((temp, pl), dataset)
+            pl = self.pl_axis
 
             # 部分負荷率
             self.pl = self.q_ch / self.q_ch_d
@@ -722,7 +2225,7 @@ class AirSourceHeatPump:
                 pl_cop = pl[-1]
                 self.flag = 3
 
-            self.cop = float(cop([[tdb, pl_cop]]))
+            self.cop = self.cop_table(float(tdb), float(pl_cop))
             # 逆カルノーサイクルに基づく定格に対する冷水出口温度変化によるCOP補正
             self.cop *= ((273.15 + self.tout_ch) / (tdb - self.tout_ch)) / (
                         (273.15 + self.tout_ch_d) / (tdb - self.tout_ch_d))
@@ -742,6 +2245,140 @@ class AirSourceHeatPump:
 
         self.dp_ch = -self.kr_ch * g_ch ** 2
 
+    # calと同じ計算を時系列・複数台分の配列でまとめて行う（機器の状態（self.tout_ch等）は更新しない）
+    # 引数はcalと同じ（配列またはスカラー）
+    # 戻り値  :q_ch, pl, cop, pw, tout_ch, dp_ch, flagの配列の辞書
+    def cal_array(self, tout_ch_sp, tin_ch, g_ch, tdb):
+        tout_ch_sp, tin_ch, g_ch, tdb = np.broadcast_arrays(
+            *[np.asarray(v, dtype=float) for v in (tout_ch_sp, tin_ch, g_ch, tdb)])
+        pl_axis = self.pl_axis
+        q_ch = (tin_ch - tout_ch_sp) * g_ch * 1000 * 4.186 / 60
+        # 処理熱量の上限を定格値とする。超える場合は冷水出口温度が上昇する
+        over = q_ch > self.q_ch_d
+        g_over = np.where(over, g_ch, 1.0)
+        tout_ch = np.where(over, tout_ch_sp + (q_ch - self.q_ch_d) / (g_over * 1000 * 4.186 / 60), tout_ch_sp)
+        q_ch = np.where(over, self.q_ch_d, q_ch)
+        flag = np.where(over, 1, 0)
+
+        run = q_ch > 0
+        pl = np.where(run, q_ch / self.q_ch_d, 0.0)
+        pl_over = run & (pl > pl_axis[-1])
+        pl_under = run & (pl < pl_axis[0])
+        pl = np.where(pl_over, pl_axis[-1], pl)
+        q_ch = np.where(pl_over, self.q_ch_d, q_ch)
+        pl_cop = np.where(pl_over | pl_under, pl_axis[-1], pl)
+        flag = np.where(pl_over, 2, np.where(pl_under, 3, flag))
+
+        cop = np.zeros_like(q_ch)
+        cop[run] = self.cop_table(tdb[run], pl_cop[run])
+        # 逆カルノーサイクルに基づく定格に対する冷水出口温度変化によるCOP補正
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cop = np.where(run, cop * ((273.15 + tout_ch) / (tdb - tout_ch)) / (
+                (273.15 + self.tout_ch_d) / (tdb - self.tout_ch_d)), 0.0)
+            pw = np.where(run, q_ch / cop + self.pw_sub, 0.0)
+        flag = np.where(run, flag, np.where(q_ch == 0, 4, 5))
+
+        return {'q_ch': q_ch, 'pl': pl, 'cop': cop, 'pw': pw, 'tout_ch': tout_ch,
+                'dp_ch': -self.kr_ch * g_ch ** 2, 'flag': flag}
+
+
+# 同じ機種の空冷HPモジュールをN台まとめて計算する（各値はN個の配列）
+# 機器特性表・補間表は1台分だけ作り、全モジュールで共有する。
+# num台目までが運転し、それ以外のモジュールの流量は0とする（台数制御はnumを変更する）
+class AirSourceHeatPumpBank:
+    def __init__(self, n=8, filename='equipment_spec.xlsx', sheet_name='AirSourceHeatPump', spec_table=None,
+                 spec=None):
+        # n     :モジュール数
+        # num   :運転台数(0~n)
+        # unit  :性能の基となるAirSourceHeatPump（定格値・補間表を共有する）
+        # その他の変数はAirSourceHeatPumpと同じ
+        self.unit = AirSourceHeatPump(filename, sheet_name, spec_table, spec)
+        self.tout_ch_d = self.unit.tout_ch_d
+        self.q_ch_d = self.unit.q_ch_d
+        self.pw_d = self.unit.pw_d
+        self.kr_ch = self.unit.kr_ch
+        self.n = n
+        self._num = n
+        # 以下、毎時刻変わる可能性のある値
+        self.tdb = 25.0
+        self.tout_ch_sp = np.full(n, 7.0)
+        self.tin_ch = np.full(n, 15.0)
+        self.g_ch = np.zeros(n)
+        self.tout_ch = np.full(n, 7.0)
+        self.q_ch = np.zeros(n)
+        self.pl = np.zeros(n)
+        self.cop = np.zeros(n)
+        self.pw = np.zeros(n)
+        self.dp_ch = np.zeros(n)
+        self.flag = np.zeros(n, dtype=int)
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def num(self):
+        return self._num
+
+    @num.setter
+    def num(self, num):
+        # 台数は整数（3.0のような整数値の小数は可）
+        if num != int(num):
+            raise ValueError('num must be an integer: {}'.format(num))
+        if not 0 <= num <= self.n:
+            raise ValueError('num must be between 0 and {}: {}'.format(self.n, num))
+        self._num = int(num)
+
+    # 運転中のモジュール（num台目まで）
+    @property
+    def running(self):
+        return np.arange(self.n) < self._num
+
+    # tout_ch_sp, tin_ch, g_ch :モジュールごとの値（スカラーは全モジュール共通）。g_chは1台あたりの流量
+    def cal(self, tout_ch_sp, tin_ch, g_ch, tdb):
+        self.tdb = tdb
+        self.tout_ch_sp = np.array(np.broadcast_to(tout_ch_sp, (self.n,)), dtype=float)
+        self.tin_ch = np.array(np.broadcast_to(tin_ch, (self.n,)), dtype=float)
+        self.g_ch = np.where(self.running, np.broadcast_to(g_ch, (self.n,)), 0.0)
+        res = self.unit.cal_array(self.tout_ch_sp, self.tin_ch, self.g_ch, tdb)
+        self.tout_ch = res['tout_ch']
+        self.q_ch = res['q_ch']
+        self.pl = res['pl']
+        self.cop = res['cop']
+        self.pw = res['pw']
+        self.dp_ch = res['dp_ch']
+        self.flag = res['flag']
+
+    # 冷水の合計流量を運転中のモジュールに均等に分配して計算する
+    def cal_total(self, tout_ch_sp, tin_ch, g_ch_total, tdb):
+        self.cal(tout_ch_sp, tin_ch, g_ch_total / self._num if self._num > 0 else 0.0, tdb)
+
+    # 合計の熱量[kW]・消費電力[kW]・流量[m3/min]
+    @property
+    def q_ch_total(self):
+        return float(self.q_ch.sum())
+
+    @property
+    def pw_total(self):
+        return float(self.pw.sum())
+
+    @property
+    def g_ch_total(self):
+        return float(self.g_ch.sum())
+
+    # 全モジュールの冷水出口の混合温度[℃]（流量がない場合は冷水出口温度設定値の平均）
+    @property
+    def tout_ch_mix(self):
+        g = self.g_ch.sum()
+        if g > 0:
+            return float((self.tout_ch * self.g_ch).sum() / g)
+        return float(self.tout_ch_sp.mean())
+
+    # 全体のCOP（停止中は0）
+    @property
+    def cop_total(self):
+        pw = self.pw.sum()
+        return float(self.q_ch.sum() / pw) if pw > 0 else 0.0
+
 
 # 省エネ基準に基づいた吸収式冷温水発生機モデル (Energy-Saving Standard) 
 class AbsorptionChillerESS:
@@ -795,7 +2432,7 @@ class AbsorptionChillerESS:
         self.tout_ch = tout_ch_sp
         if self.capacity_c > self.rated_capacity_c:  # 処理熱量が定格能力より大きい時の冷水出口温度を求める
             delta_t = (self.capacity_c - self.rated_capacity_c) / (g * self.cw_c)
-            self.tout_ch = tout_chsp + delta_t
+            self.tout_ch = tout_ch_sp + delta_t
             self.capacity_c = self.rated_capacity_c
 
         plr = self.capacity_c / capacity
@@ -846,6 +2483,54 @@ class AbsorptionChillerESS:
 
         return self.capacity_h, self.input_fuel_h, self.cop_h, self.tout_h, self.power_h
 
+    # cal_cと同じ計算を配列でまとめて行う（機器の状態は更新しない）
+    # 引数は配列またはスカラーで、互いにブロードキャストされる（例：定格値を(機種数, 1)、流量を(8760,)の配列とする）
+    # rated_capacity_c, rated_input_fuel_c, power_c :Noneの場合は機器の定格値
+    # 戻り値  :capacity_c, input_fuel_c, cop_c, tout_ch, power_cの配列
+    def cal_c_array(self, g, tin_cd=32, tin_ch=15, tout_ch_sp=7, rated_capacity_c=None, rated_input_fuel_c=None,
+                    power_c=None):
+        rated_capacity_c = self.rated_capacity_c if rated_capacity_c is None else rated_capacity_c
+        rated_input_fuel_c = self.rated_input_fuel_c if rated_input_fuel_c is None else rated_input_fuel_c
+        power_c = self.power_c if power_c is None else power_c
+        g, tin_cd, tin_ch, tout_ch_sp, rated_capacity_c, rated_input_fuel_c, power_c = np.broadcast_arrays(
+            *[np.asarray(v, dtype=float) for v in
+              (g, tin_cd, tin_ch, tout_ch_sp, rated_capacity_c, rated_input_fuel_c, power_c)])
+
+        g = g * self.rho_c / 60  # 体積流量[m3/min] to 質量流量[kg/s]
+        capacity_c = g * (tin_ch - tout_ch_sp) * self.cw_c
+        over = capacity_c > rated_capacity_c
+        g_over = np.where(over, g, 1.0)
+        tout_ch = np.where(over, tout_ch_sp + (capacity_c - rated_capacity_c) / (g_over * self.cw_c), tout_ch_sp)
+        capacity_c = np.where(over, rated_capacity_c, capacity_c)
+
+        plr = np.clip(capacity_c / rated_capacity_c, 0.2, 1)
+        k_2 = 0.012333 * tin_cd + 0.605333  # 最大入力比
+        k_3 = 0.167757 * plr ** 2 + 0.757814 * plr + 0.074429  # 入力比
+        k_4 = -0.01276 * tout_ch + 1.0893  # 入力比
+        input_fuel_c = rated_input_fuel_c * k_2 * k_3 * k_4
+        cop_c = capacity_c / (input_fuel_c * self.cg / self.k + power_c)
+        return capacity_c, input_fuel_c, cop_c, tout_ch, power_c
+
+    # cal_hと同じ計算を配列でまとめて行う（引数・戻り値はcal_c_arrayと同様）
+    def cal_h_array(self, g, tin_h=37, tout_h_sp=45, rated_capacity_h=None, rated_input_fuel_h=None, power_h=None):
+        rated_capacity_h = self.rated_capacity_h if rated_capacity_h is None else rated_capacity_h
+        rated_input_fuel_h = self.rated_input_fuel_h if rated_input_fuel_h is None else rated_input_fuel_h
+        power_h = self.power_h if power_h is None else power_h
+        g, tin_h, tout_h_sp, rated_capacity_h, rated_input_fuel_h, power_h = np.broadcast_arrays(
+            *[np.asarray(v, dtype=float) for v in (g, tin_h, tout_h_sp, rated_capacity_h, rated_input_fuel_h, power_h)])
+
+        g = g * self.rho_h / 60  # 体積流量[m3/min] to 質量流量[kg/s]
+        capacity_h = g * (tout_h_sp - tin_h) * self.cw_h
+        over = capacity_h > rated_capacity_h
+        g_over = np.where(over, g, 1.0)
+        tout_h = np.where(over, tout_h_sp - (capacity_h - rated_capacity_h) / (g_over * self.cw_h), tout_h_sp)
+        capacity_h = np.where(over, rated_capacity_h, capacity_h)
+
+        plr = np.clip(capacity_h / rated_capacity_h, 0.1, 1)
+        input_fuel_h = rated_input_fuel_h * plr
+        cop_h = capacity_h / (input_fuel_h * self.cg / self.k + power_h)
+        return capacity_h, input_fuel_h, cop_h, tout_h, power_h
+
 
 # 省エネ基準に基づいたVRFモデル (Energy-Saving Standard)　
 class VariableRefrigerantFlowESS:
@@ -933,13 +2618,169 @@ class VariableRefrigerantFlowESS:
 
         return self.capacity_h, self.input_power_h, self.cop_h
 
+    # cal_cと同じ計算を配列でまとめて行う（機器の状態は更新しない）
+    # 引数は配列またはスカラーで、互いにブロードキャストされる（例：定格値を(機種数, 1)、外気温度を(8760,)の配列とする）
+    # rated_capacity_c, rated_input_power_c :Noneの場合は機器の定格値
+    # 戻り値  :capacity_c, input_power_c, cop_cの配列
+    def cal_c_array(self, odb, indoor_capacity, rated_capacity_c=None, rated_input_power_c=None):
+        rated_capacity_c = self.rated_capacity_c if rated_capacity_c is None else rated_capacity_c
+        rated_input_power_c = self.rated_input_power_c if rated_input_power_c is None else rated_input_power_c
+        odb, indoor_capacity, rated_capacity_c, rated_input_power_c = np.broadcast_arrays(
+            *[np.asarray(v, dtype=float) for v in (odb, indoor_capacity, rated_capacity_c, rated_input_power_c)])
+
+        odb = np.clip(odb, 15, 43)  # 外気乾球温度の下限・上限
+        k_1 = -0.0025 * odb + 1.0875  # 能力比特性
+        capacity_a = rated_capacity_c * k_1  # その外気条件での最大能力
+        cr = indoor_capacity / rated_capacity_c
+        capacity_c = np.where(cr < 1, np.minimum(indoor_capacity, capacity_a), capacity_a)
+
+        plr = np.clip(capacity_c / capacity_a, 0.3, 1)
+        k_2 = 0.0001212 * odb ** 2 + 0.00369 * odb + 0.72238  # 入力比特性
+        k_3 = 0.8573 * plr ** 2 - 0.0456 * plr + 0.1883  # 部分負荷特性
+        input_power_c = rated_input_power_c * k_2 * k_3
+        return capacity_c, input_power_c, capacity_c / input_power_c
+
+    # cal_hと同じ計算を配列でまとめて行う（引数・戻り値はcal_c_arrayと同様）
+    def cal_h_array(self, owb, indoor_capacity, rated_capacity_h=None, rated_input_power_h=None):
+        rated_capacity_h = self.rated_capacity_h if rated_capacity_h is None else rated_capacity_h
+        rated_input_power_h = self.rated_input_power_h if rated_input_power_h is None else rated_input_power_h
+        owb, indoor_capacity, rated_capacity_h, rated_input_power_h = np.broadcast_arrays(
+            *[np.asarray(v, dtype=float) for v in (owb, indoor_capacity, rated_capacity_h, rated_input_power_h)])
+
+        owb = np.clip(owb, -20, 15)  # 外気湿球温度の下限・上限
+        k_1 = np.where((-8 < owb) & (owb <= 4.5), 0.0153 * owb + 0.762, 0.0255 * owb + 0.847)  # 能力比特性
+        capacity_a = rated_capacity_h * k_1
+        cr = indoor_capacity / rated_capacity_h
+        capacity_h = np.where(cr < 1, np.minimum(indoor_capacity, capacity_a), capacity_a)
+
+        plr = np.clip(capacity_h / capacity_a, 0.3, 1)
+        k_2 = 0.0128 * owb + 0.9232  # 入力比特性
+        k_3 = 0.7823 * plr ** 2 + 0.0398 * plr + 0.1779  # 部分負荷特性
+        input_power_h = rated_input_power_h * k_2 * k_3
+        return capacity_h, input_power_h, capacity_h / input_power_h
+
+
+# EnergyPlusの性能曲線（Curve:Linear, Quadratic, Cubic, Biquadratic）
+# 係数は機器の構築時に一度だけ求めておき、計算時は多項式の評価のみ行う。x, yはスカラーまたは配列
+class _Curve:
+    n_coef = 0
+
+    def __init__(self, coef):
+        coef = [float(c) for c in coef]
+        if len(coef) != self.n_coef:
+            raise ValueError('{} needs {} coefficients: {}'.format(type(self).__name__, self.n_coef, coef))
+        self.coef = coef
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, self.coef)
+
+
+# c0 + c1*x
+class LinearCurve(_Curve):
+    n_coef = 2
+
+    def __call__(self, x):
+        c0, c1 = self.coef
+        return c0 + c1 * x
+
+
+# c0 + c1*x + c2*x**2
+class QuadraticCurve(_Curve):
+    n_coef = 3
+
+    def __call__(self, x):
+        c0, c1, c2 = self.coef
+        return c0 + c1 * x + c2 * x ** 2
+
+
+# c0 + c1*x + c2*x**2 + c3*x**3
+class CubicCurve(_Curve):
+    n_coef = 4
+
+    def __call__(self, x):
+        c0, c1, c2, c3 = self.coef
+        return c0 + c1 * x + c2 * x ** 2 + c3 * x ** 3
+
+
+# c0 + c1*x + c2*x**2 + c3*y + c4*y**2 + c5*x*y
+class BiquadraticCurve(_Curve):
+    n_coef = 6
+
+    def __call__(self, x, y):
+        c0, c1, c2, c3, c4, c5 = self.coef
+        return c0 + c1 * x + c2 * x ** 2 + c3 * y + c4 * y ** 2 + c5 * x * y
+
+
+# 回帰分析の設定。係数のキャッシュのキーに含めるので、回帰の方法を変更した場合はversionを更新する
+VRF_CURVE_FIT_SETTINGS = {'version': 1, 'method': 'LinearRegression', 'fit_intercept': True}
+
+
+# 重回帰分析（データセットの列がそのまま説明変数）。戻り値は[切片, 係数1, 係数2, ...]
+def _fit_coef(x_data, y_data):
+    from sklearn.linear_model import LinearRegression
+    model = LinearRegression(fit_intercept=VRF_CURVE_FIT_SETTINGS['fit_intercept'])
+    model.fit(x_data, y_data)
+    return [float(model.intercept_)] + [float(c) for c in model.coef_]
+
+
+# 性能曲線の係数のキャッシュ
+# 回帰に用いるデータセットと回帰分析の設定（VRF_CURVE_FIT_SETTINGS）のハッシュをキーとして、
+# 求めた係数をプロセス内とjsonファイル（cache_file）に保存する。
+# データセットが同じであれば次回以降は回帰分析を行わない（scikit-learnも読み込まない）。
+VRF_CURVE_CACHE_SUFFIX = '.curves.json'
+_CURVE_COEF_CACHE = {}
+
+
+# datasets   :{曲線名: (説明変数のDataFrame, 目的変数のSeries)}
+# cache_file :係数を保存するjsonファイル（Noneの場合はプロセス内のみ）
+# 戻り値      :{曲線名: [切片, 係数1, 係数2, ...]}
+def _fit_curves(datasets, cache_file=None):
+    digest = hashlib.sha256(json.dumps(VRF_CURVE_FIT_SETTINGS, sort_keys=True).encode())
+    for name in sorted(datasets):
+        x_data, y_data = datasets[name]
+        for values in (np.asarray(x_data, dtype=float), np.asarray(y_data, dtype=float)):
+            digest.update(name.encode())
+            digest.update(repr(values.shape).encode())
+            digest.update(np.ascontiguousarray(values).tobytes())
+    key = digest.hexdigest()
+    if key in _CURVE_COEF_CACHE:
+        return _CURVE_COEF_CACHE[key]
+
+    stored = _read_curve_cache(cache_file) if cache_file is not None else {}
+    if key in stored:
+        coef = stored[key]
+    else:
+        coef = {name: _fit_coef(x_data, y_data) for name, (x_data, y_data) in datasets.items()}
+        if cache_file is not None:
+            # 回帰分析の間に他のプロセスが書き込んだ係数を消さないよう、書き込む直前に読み直して加える
+            stored = _read_curve_cache(cache_file)
+            stored[key] = coef
+            _write_cache_file(cache_file, lambda f: json.dump(stored, f, indent=1), 'curve')
+    _CURVE_COEF_CACHE[key] = coef
+    return coef
+
+
+def _read_curve_cache(cache_file):
+    if not os.path.exists(cache_file):
+        return {}
+    try:
+        with open(cache_file, 'r') as f:
+            stored = json.load(f)
+        if isinstance(stored, dict):
+            return stored
+    except (OSError, ValueError):
+        pass
+    print('warning: curve cache is broken and refitted: {}'.format(cache_file))
+    return {}
+
 
 # EnergyPlusに基づいたVRFモデル
 # EnergyPlus Engineering Reference(22.1), Variable Refrigerant Flow Heat Pumps, System Curve based VRF Model
 # Raustad, R.A., (2012) Creating Performance Curves for Variable Refrigerant Flow Heat Pumps in EnergyPlus
 # Cooling Mode
 class VariableRefrigerantFlowEP:
-    def __init__(self, rated_capacity=31.6548, rated_input_power=9.73, length=10, height=5):
+    def __init__(self, rated_capacity=31.6548, rated_input_power=9.73, length=10, height=5,
+                 filename='equipment_spec.xlsx', spec=None, curve_cache=False):
 
         self.rated_capacity = rated_capacity  # kW
         self.rated_input_power = rated_input_power  # kW
@@ -952,40 +2793,41 @@ class VariableRefrigerantFlowEP:
         self.cr = 0  # combination ratio = (rated part load ratio)
 
         # datasets for regression analysis
-        boundary = pd.read_excel('equipment_spec.xlsx', sheet_name='boundary_dataset', header=None)
-        boundary = boundary.drop(boundary.index[0])
-        self.boundary = pd.DataFrame(boundary, dtype='float64')
-
-        low_temp_c = pd.read_excel('equipment_spec.xlsx', sheet_name='lowt_dataset_c', header=None)
-        low_temp_c = low_temp_c.drop(low_temp_c.index[0])
-        self.low_temp_c = pd.DataFrame(low_temp_c, dtype='float64')
-
-        low_temp_p = pd.read_excel('equipment_spec.xlsx', sheet_name='lowt_dataset_p', header=None)
-        low_temp_p = low_temp_p.drop(low_temp_p.index[0])
-        self.low_temp_p = pd.DataFrame(low_temp_p, dtype='float64')
-
-        high_temp_c = pd.read_excel('equipment_spec.xlsx', sheet_name='hight_dataset_c', header=None)
-        high_temp_c = high_temp_c.drop(high_temp_c.index[0])
-        self.high_temp_c = pd.DataFrame(high_temp_c, dtype='float64')
-
-        high_temp_p = pd.read_excel('equipment_spec.xlsx', sheet_name='hight_dataset_p', header=None)
-        high_temp_p = high_temp_p.drop(high_temp_p.index[0])
-        self.high_temp_p = pd.DataFrame(high_temp_p, dtype='float64')
+        self.boundary = _spec_dataset('boundary_dataset', filename, spec)
+        self.low_temp_c = _spec_dataset('lowt_dataset_c', filename, spec)
+        self.low_temp_p = _spec_dataset('lowt_dataset_p', filename, spec)
+        self.high_temp_c = _spec_dataset('hight_dataset_c', filename, spec)
+        self.high_temp_p = _spec_dataset('hight_dataset_p', filename, spec)
+        # correction curves (read once here, not at every call)
+        self.cr_data = _spec_dataset('cr_correction', filename, spec)
+        self.eirfplr_data = _spec_dataset('eirfplr', filename, spec, dropna=True)
+        self.pipe_data = _spec_dataset('piping_correction', filename, spec)
+
+        # performance curves fitted once here (not at every call)
+        # boundary: odb_boundary(iwb), capft/eirft: f(iwb, odb), cr: f(cr), eirfplr: f(cr), piping: f(length, cr)
+        # the coefficients are cached in "<filename>.curves.json" when curve_cache=True
+        coef = _fit_curves({
+            'boundary': (self.boundary.iloc[:, 1:], self.boundary.iloc[:, 0]),
+            'capft_l': (self.low_temp_c.iloc[:, 1:], self.low_temp_c.iloc[:, 0]),
+            'eirft_l': (self.low_temp_p.iloc[:, 3:], self.low_temp_p.iloc[:, 2]),
+            'capft_h': (self.high_temp_c.iloc[:, 1:], self.high_temp_c.iloc[:, 0]),
+            'eirft_h': (self.high_temp_p.iloc[:, 3:], self.high_temp_p.iloc[:, 2]),
+            'cr': (self.cr_data.iloc[:, 1:2], self.cr_data.iloc[:, 0]),
+            'eirfplr': (self.eirfplr_data.iloc[:, 3:], self.eirfplr_data.iloc[:, 1]),
+            'piping': (self.pipe_data.iloc[:, 1:], self.pipe_data.iloc[:, 0]),
+        }, filename + VRF_CURVE_CACHE_SUFFIX if curve_cache else None)
+        self.boundary_curve = QuadraticCurve(coef['boundary'])
+        self.capft_l = BiquadraticCurve(coef['capft_l'])
+        self.eirft_l = BiquadraticCurve(coef['eirft_l'])
+        self.capft_h = BiquadraticCurve(coef['capft_h'])
+        self.eirft_h = BiquadraticCurve(coef['eirft_h'])
+        self.cr_curve = LinearCurve(coef['cr'])
+        self.eirfplr_curve = CubicCurve(coef['eirfplr'])
+        self.piping_curve = BiquadraticCurve(coef['piping'])
 
     # combination ratio correction factor
     def get_cr_correction(self):
-        cr_data = pd.read_excel('equipment_spec.xlsx', sheet_name='cr_correction', header=None)
-        cr_data = cr_data.drop(cr_data.index[0])
-        cr_data = pd.DataFrame(cr_data, dtype='float64')
-
-        x_data = np.array(cr_data.iloc[:, 1]).reshape(-1, 1)
-        y_data = np.array(cr_data.iloc[:, 0]).reshape(-1, 1)
-        model = LinearRegression()
-        model.fit(x_data, y_data)
-        a = model.coef_
-        b = model.intercept_
-        cr_correction_factor = a * self.cr + b
-        cr_correction_factor = cr_correction_factor[0][0]
+        cr_correction_factor = self.cr_curve(self.cr)
 
         if cr_correction_factor <= 1:
             return 1
@@ -996,35 +2838,11 @@ class VariableRefrigerantFlowEP:
     def get_eirfplr(self):
 
         if self.cr <= 1:
-            eirfplr_data = pd.read_excel('equipment_spec.xlsx', sheet_name='eirfplr', header=None)
-            eirfplr_data = eirfplr_data.drop(eirfplr_data.index[0])
-            eirfplr_data = eirfplr_data.dropna(how='all', axis=1)
-            eirfplr_data = pd.DataFrame(eirfplr_data, dtype='float64')
-
-            x_data = eirfplr_data.iloc[:, 3:]
-            y_data = eirfplr_data.iloc[:, 1]
-            model = LinearRegression()
-            model.fit(x_data, y_data)
-            a, b, c = model.coef_
-            d = model.intercept_
-            eirfplr = a * self.cr + b * self.cr ** 2 + c * self.cr ** 3 + d
-
-            return eirfplr
+            return self.eirfplr_curve(self.cr)
 
     # piping correction factor for length and height
     def get_piping_correction(self):
-        pipe_data = pd.read_excel('equipment_spec.xlsx', sheet_name='piping_correction', header=None)
-        pipe_data = pipe_data.drop(pipe_data.index[0])
-        pipe_data = pd.DataFrame(pipe_data, dtype='float64')
-
-        x_data = pipe_data.iloc[:, 1:]
-        y_data = pipe_data.iloc[:, 0]
-        model = LinearRegression()
-        model.fit(x_data, y_data)
-        a = model.intercept_
-        b, c, d, e, f = model.coef_
-        piping_correction_length = a + b * self.length + c * self.length ** 2 + d * self.cr + e * self.cr ** 2 \
-                                   + f * self.length * self.cr
+        piping_correction_length = self.piping_curve(self.length, self.cr)
 
         piping_correction_height = 1 - 0.0019231 * self.height
 
@@ -1120,80 +2938,43 @@ class VariableRefrigerantFlowEP:
 
     # calculation in the condition of "cr=1"
     def cal(self, iwb, odb):
-        # regression analysis for Cooling Capacity Ratio Boundary performance curve
-        x_data_b = self.boundary.iloc[:, 1:]
-        y_data_b = self.boundary.iloc[:, 0]
-        model_b = LinearRegression()
-        model_b.fit(x_data_b, y_data_b)
-        a = model_b.intercept_
-        b, c = model_b.coef_
-        odb_boundary = a + b * iwb + c * iwb ** 2
+        # Cooling Capacity Ratio Boundary performance curve
+        odb_boundary = self.boundary_curve(iwb)
 
         # If the input outdoor dry-bulb temperature is lower than the calculated 'odb_boundary'
         # the low temperature region performance curve is used
         # else the high temperature region performance curve is used
         if odb <= odb_boundary:
-            # regression analysis for Cooling Capacity Ratio Modifier Function of Low Temperatures
-            x_data_c = self.low_temp_c.iloc[:, 1:]
-            y_data_c = self.low_temp_c.iloc[:, 0]
-            model_c = LinearRegression()
-            model_c.fit(x_data_c, y_data_c)
-            intercept_c = model_c.intercept_
-            coef_c = model_c.coef_
-            capft = intercept_c + coef_c[0] * iwb + coef_c[1] * iwb ** 2 \
-                    + coef_c[2] * odb + coef_c[3] * odb ** 2 + coef_c[4] * iwb * odb
-
-            capacity = self.rated_capacity * capft
-
-            # regression analysis for Input Power Ratio Modifier Function of Low Temperatures
-            x_data_p = self.low_temp_p.iloc[:, 3:]
-            y_data_p = self.low_temp_p.iloc[:, 2]
-            model_p = LinearRegression()
-            model_p.fit(x_data_p, y_data_p)
-            intercept_p = model_p.intercept_
-            coef_p = model_p.coef_
-            eirft = intercept_p + coef_p[0] * iwb + coef_p[1] * iwb ** 2 \
-                    + coef_p[2] * odb + coef_p[3] * odb ** 2 + coef_p[4] * iwb * odb
-            power_ratio = eirft * capft
-
-            input_power = self.rated_input_power * power_ratio
-            cop = capacity / input_power
-
-            return capacity, input_power, cop
-
+            # Cooling Capacity / Input Power Ratio Modifier Function of Low Temperatures
+            capft = self.capft_l(iwb, odb)
+            eirft = self.eirft_l(iwb, odb)
         else:
-            # regression analysis for Cooling Capacity Ratio Modifier Function of High Temperatures
-            x_data_c = self.high_temp_c.iloc[:, 1:]
-            y_data_c = self.high_temp_c.iloc[:, 0]
-            model_c = LinearRegression()
-            model_c.fit(x_data_c, y_data_c)
-            intercept_c = model_c.intercept_
-            coef_c = model_c.coef_
-            capft = intercept_c + coef_c[0] * iwb + coef_c[1] * iwb ** 2 \
-                    + coef_c[2] * odb + coef_c[3] * odb ** 2 + coef_c[4] * iwb * odb
-
-            capacity = self.rated_capacity * capft
-
-            # regression analysis for Input Power Ratio Modifier Function of High Temperatures
-            x_data_p = self.high_temp_p.iloc[:, 3:]
-            y_data_p = self.high_temp_p.iloc[:, 2]
-            model_p = LinearRegression()
-            model_p.fit(x_data_p, y_data_p)
-            intercept_p = model_p.intercept_
-            coef_p = model_p.coef_
-            eirft = intercept_p + coef_p[0] * iwb + coef_p[1] * iwb ** 2 \
-                    + coef_p[2] * odb + coef_p[3] * odb ** 2 + coef_p[4] * iwb * odb
-            power_ratio = eirft * capft
+            # Cooling Capacity / Input Power Ratio Modifier Function of High Temperatures
+            capft = self.capft_h(iwb, odb)
+            eirft = self.eirft_h(iwb, odb)
 
-            input_power = self.rated_input_power * power_ratio
-            cop = capacity / input_power
+        capacity = self.rated_capacity * capft
+        power_ratio = eirft * capft
+        input_power = self.rated_input_power * power_ratio
+        cop = capacity / input_power
 
-            return capacity, input_power, cop
+        return capacity, input_power, cop
+
+    # calと同じ計算を配列でまとめて行う（iwb, odbは配列またはスカラー）
+    def cal_array(self, iwb, odb):
+        iwb, odb = np.broadcast_arrays(np.asarray(iwb, dtype=float), np.asarray(odb, dtype=float))
+        low = odb <= self.boundary_curve(iwb)
+        capft = np.where(low, self.capft_l(iwb, odb), self.capft_h(iwb, odb))
+        eirft = np.where(low, self.eirft_l(iwb, odb), self.eirft_h(iwb, odb))
+        capacity = self.rated_capacity * capft
+        input_power = self.rated_input_power * (eirft * capft)
+        return capacity, input_power, capacity / input_power
 
 
 # HeatingMode
 class VRFEPHeatingMode:
-    def __init__(self, rated_capacity=37.5, rated_input_power=10.59, length=10, height=5):
+    def __init__(self, rated_capacity=37.5, rated_input_power=10.59, length=10, height=5,
+                 filename='equipment_spec.xlsx', spec=None, curve_cache=False):
 
         self.rated_capacity = rated_capacity  # kW
         self.rated_input_power = rated_input_power  # kW
@@ -1206,43 +2987,51 @@ class VRFEPHeatingMode:
         self.height = height  # vertical height of the difference between the highest and lowest terminal unit, m
 
         # dataset for regression analysis
-        boundary_c = pd.read_excel('equipment_spec.xlsx', sheet_name='boundary_dataset_c', header=None)
-        boundary_c = boundary_c.drop(boundary_c.index[0])
-        self.boundary_c = pd.DataFrame(boundary_c, dtype='float64')
-
-        boundary_p = pd.read_excel('equipment_spec.xlsx', sheet_name='boundary_dataset_p', header=None)
-        boundary_p = boundary_p.drop(boundary_p.index[0])
-        self.boundary_p = pd.DataFrame(boundary_p, dtype='float64')
-
-        low_temp_c = pd.read_excel('equipment_spec.xlsx', sheet_name='lowt_dataset_c_h', header=None)
-        low_temp_c = low_temp_c.drop(low_temp_c.index[0])
-        self.low_temp_c = pd.DataFrame(low_temp_c, dtype='float64')
-
-        low_temp_p = pd.read_excel('equipment_spec.xlsx', sheet_name='lowt_dataset_p_h', header=None)
-        low_temp_p = low_temp_p.drop(low_temp_p.index[0])
-        self.low_temp_p = pd.DataFrame(low_temp_p, dtype='float64')
-
-        high_temp_c = pd.read_excel('equipment_spec.xlsx', sheet_name='hight_dataset_c_h', header=None)
-        high_temp_c = high_temp_c.drop(high_temp_c.index[0])
-        self.high_temp_c = pd.DataFrame(high_temp_c, dtype='float64')
-
-        high_temp_p = pd.read_excel('equipment_spec.xlsx', sheet_name='hight_dataset_p_h', header=None)
-        high_temp_p = high_temp_p.drop(high_temp_p.index[0])
-        self.high_temp_p = pd.DataFrame(high_temp_p, dtype='float64')
+        self.boundary_c = _spec_dataset('boundary_dataset_c', filename, spec)
+        self.boundary_p = _spec_dataset('boundary_dataset_p', filename, spec)
+        self.low_temp_c = _spec_dataset('lowt_dataset_c_h', filename, spec)
+        self.low_temp_p = _spec_dataset('lowt_dataset_p_h', filename, spec)
+        self.high_temp_c = _spec_dataset('hight_dataset_c_h', filename, spec)
+        self.high_temp_p = _spec_dataset('hight_dataset_p_h', filename, spec)
+        # correction curves (read once here, not at every call)
+        self.cr_data = _spec_dataset('cr_correction_h', filename, spec)
+        self.eirfplr_l = _spec_dataset('eirfplr_l', filename, spec, dropna=True)
+        self.eirfplr_h = _spec_dataset('eirfplr_h', filename, spec, dropna=True)
+        self.pipe_data = _spec_dataset('piping_correction_h', filename, spec)
+        self.df_data = _spec_dataset('df_correction', filename, spec)
+
+        # performance curves fitted once here (not at every call)
+        # boundary: owb_boundary(idb), capft/eirft: f(idb, owb), cr/eirfplr: f(cr), piping: f(length), defrost: f(owb)
+        # the coefficients are cached in "<filename>.curves.json" when curve_cache=True
+        coef = _fit_curves({
+            'boundary_c': (self.boundary_c.iloc[:, 1:], self.boundary_c.iloc[:, 0]),
+            'boundary_p': (self.boundary_p.iloc[:, 1:], self.boundary_p.iloc[:, 0]),
+            'capft_l': (self.low_temp_c.iloc[:, 1:], self.low_temp_c.iloc[:, 0]),
+            'capft_h': (self.high_temp_c.iloc[:, 1:], self.high_temp_c.iloc[:, 0]),
+            'eirft_l': (self.low_temp_p.iloc[:, 3:], self.low_temp_p.iloc[:, 2]),
+            'eirft_h': (self.high_temp_p.iloc[:, 3:], self.high_temp_p.iloc[:, 2]),
+            'cr': (self.cr_data.iloc[:, 1:], self.cr_data.iloc[:, 0]),
+            'eirfplr_l': (self.eirfplr_l.iloc[:, 3:], self.eirfplr_l.iloc[:, 1]),
+            'eirfplr_h': (self.eirfplr_h.iloc[:, 3:], self.eirfplr_h.iloc[:, 1]),
+            'piping': (self.pipe_data.iloc[:, 1:], self.pipe_data.iloc[:, 0]),
+            'defrost': (self.df_data.iloc[:, 1:], self.df_data.iloc[:, 0]),
+        }, filename + VRF_CURVE_CACHE_SUFFIX if curve_cache else None)
+        self.boundary_c_curve = QuadraticCurve(coef['boundary_c'])
+        self.boundary_p_curve = QuadraticCurve(coef['boundary_p'])
+        self.capft_l = BiquadraticCurve(coef['capft_l'])
+        self.capft_h = BiquadraticCurve(coef['capft_h'])
+        self.eirft_l = BiquadraticCurve(coef['eirft_l'])
+        self.eirft_h = BiquadraticCurve(coef['eirft_h'])
+        self.cr_curve = CubicCurve(coef['cr'])
+        self.eirfplr_l_curve = CubicCurve(coef['eirfplr_l'])
+        # 従来どおり、切片を3次の係数、回帰係数を0~2次の係数として用いる
+        self.eirfplr_h_curve = CubicCurve(coef['eirfplr_h'][1:] + coef['eirfplr_h'][:1])
+        self.piping_curve = CubicCurve(coef['piping'])
+        self.df_curve = CubicCurve(coef['defrost'])
 
     # combination ratio correction factor
     def get_cr_correction(self):
-        cr_data = pd.read_excel('equipment_spec.xlsx', sheet_name='cr_correction_h', header=None)
-        cr_data = cr_data.drop(cr_data.index[0])
-        cr_data = pd.DataFrame(cr_data, dtype='float64')
-
-        x_data = cr_data.iloc[:, 1:]
-        y_data = cr_data.iloc[:, 0]
-        model = LinearRegression()
-        model.fit(x_data, y_data)
-        a = model.intercept_
-        b, c, d = model.coef_
-        cr_correction_factor = a + b * self.cr + c * self.cr ** 2 + d * self.cr ** 3
+        cr_correction_factor = self.cr_curve(self.cr)
 
         if cr_correction_factor <= 1:
             return 1
@@ -1253,50 +3042,14 @@ class VRFEPHeatingMode:
     def get_eirfplr(self):
 
         if self.cr <= 1:
-            eirfplr_l = pd.read_excel('equipment_spec.xlsx', sheet_name='eirfplr_l', header=None)
-            eirfplr_l = eirfplr_l.drop(eirfplr_l.index[0])
-            eirfplr_l = eirfplr_l.dropna(how='all', axis=1)
-            eirfplr_l = pd.DataFrame(eirfplr_l, dtype='float64')
-
-            x_data = eirfplr_l.iloc[:, 3:]
-            y_data = eirfplr_l.iloc[:, 1]
-            model = LinearRegression()
-            model.fit(x_data, y_data)
-            a = model.intercept_
-            b, c, d = model.coef_
-            eirfplr = a + b * self.cr + c * self.cr ** 2 + d * self.cr ** 3
-
-            return eirfplr
+            return self.eirfplr_l_curve(self.cr)
 
         if self.cr > 1:
-            eirfplr_h = pd.read_excel('equipment_spec.xlsx', sheet_name='eirfplr_h', header=None)
-            eirfplr_h = eirfplr_h.drop(eirfplr_h.index[0])
-            eirfplr_h = eirfplr_h.dropna(how='all', axis=1)
-            eirfplr_h = pd.DataFrame(eirfplr_h, dtype='float64')
-
-            x_data = eirfplr_h.iloc[:, 3:]
-            y_data = eirfplr_h.iloc[:, 1]
-            model = LinearRegression()
-            model.fit(x_data, y_data)
-            a, b, c = model.coef_
-            d = model.intercept_
-            eirfplr = a + b * self.cr + c * self.cr ** 2 + d * self.cr ** 3
-
-            return eirfplr
+            return self.eirfplr_h_curve(self.cr)
 
     # piping correction factor for length and height
     def get_piping_correction(self):
-        pipe_data = pd.read_excel('equipment_spec.xlsx', sheet_name='piping_correction_h', header=None)
-        pipe_data = pipe_data.drop(pipe_data.index[0])
-        pipe_data = pd.DataFrame(pipe_data, dtype='float64')
-
-        x_data = pipe_data.iloc[:, 1:]
-        y_data = pipe_data.iloc[:, 0]
-        model = LinearRegression()
-        model.fit(x_data, y_data)
-        a = model.intercept_
-        b, c, d = model.coef_
-        piping_correction_length = a + b * self.length + c * self.length ** 2 + d * self.length ** 3
+        piping_correction_length = self.piping_curve(self.length)
 
         piping_correction_height = 0
 
@@ -1311,19 +3064,7 @@ class VRFEPHeatingMode:
         if owb > 5.84:
             owb = 5.84
 
-        df_data = pd.read_excel('equipment_spec.xlsx', sheet_name='df_correction', header=None)
-        df_data = df_data.drop(df_data.index[0])
-        df_data = pd.DataFrame(df_data, dtype='float64')
-
-        x_data = df_data.iloc[:, 1:]
-        y_data = df_data.iloc[:, 0]
-        model = LinearRegression()
-        model.fit(x_data, y_data)
-        a = model.intercept_
-        b, c, d = model.coef_
-        defrost_correction = a + b * owb + c * owb ** 2 + d * owb ** 3
-
-        return defrost_correction
+        return self.df_curve(owb)
 
     # calculation in the condition that pipe loss and defrost correction is considered
     def cal_loss(self, idb, owb, indoor_capacity):
@@ -1413,59 +3154,15 @@ class VRFEPHeatingMode:
 
     # calculation in the condition of "cr==1"
     def cal(self, idb, owb):
-        # regression analysis for Heating Capacity Ratio Boundary performance curve
-        x_data_c = self.boundary_c.iloc[:, 1:]
-        y_data_c = self.boundary_c.iloc[:, 0]
-        model = LinearRegression()
-        model.fit(x_data_c, y_data_c)
-        ac = model.intercept_
-        bc, cc = model.coef_
-        boundary_c = ac + bc * idb + cc * idb ** 2
-
-        # regression analysis for Heating Input Power Boundary performance curve
-        x_data_p = self.boundary_p.iloc[:, 1:]
-        y_data_p = self.boundary_p.iloc[:, 0]
-        model = LinearRegression()
-        model.fit(x_data_p, y_data_p)
-        ap = model.intercept_
-        bp, cp = model.coef_
-        boundary_p = ap + bp * idb + cp * idb ** 2
-
-        # regression analysis for Heating Capacity Ratio Modifier Function of Low Temperatures
-        x_data_c_l = self.low_temp_c.iloc[:, 1:]
-        y_data_c_l = self.low_temp_c.iloc[:, 0]
-        model_c = LinearRegression()
-        model_c.fit(x_data_c_l, y_data_c_l)
-        al = model_c.intercept_
-        bl, cl, dl, el, fl = model_c.coef_
-        capft_l = al + bl * idb + cl * idb ** 2 + dl * owb + el * owb ** 2 + fl * idb * owb
-
-        # regression analysis for Heating Capacity Ratio Modifier Function of High Temperatures
-        x_data_c_h = self.high_temp_c.iloc[:, 1:]
-        y_data_c_h = self.high_temp_c.iloc[:, 0]
-        model_c_h = LinearRegression()
-        model_c_h.fit(x_data_c_h, y_data_c_h)
-        ah = model_c_h.intercept_
-        bh, ch, dh, eh, fh = model_c_h.coef_
-        capft_h = ah + bh * idb + ch * idb ** 2 + dh * owb + eh * owb ** 2 + fh * idb * owb
-
-        # regression analysis for Input Power Ratio Modifier Function of Low Temperatures
-        x_data_p_l = self.low_temp_p.iloc[:, 3:]
-        y_data_p_l = self.low_temp_p.iloc[:, 2]
-        model_p_l = LinearRegression()
-        model_p_l.fit(x_data_p_l, y_data_p_l)
-        gl = model_p_l.intercept_
-        hl, il, jl, kl, ll = model_p_l.coef_
-        eirft_l = gl + hl * idb + il * idb ** 2 + jl * owb + kl * owb ** 2 + ll * idb * owb
-
-        # regression analysis for Input Power Ratio Modifier Function of High Temperatures
-        x_data_p_h = self.high_temp_p.iloc[:, 3:]
-        y_data_p_h = self.high_temp_p.iloc[:, 2]
-        model_p_h = LinearRegression()
-        model_p_h.fit(x_data_p_h, y_data_p_h)
-        gh = model_p_h.intercept_
-        hh, ih, jh, kh, lh = model_p_h.coef_
-        eirft_h = gh + hh * idb + ih * idb ** 2 + jh * owb + kh * owb ** 2 + lh * idb * owb
+        # Heating Capacity Ratio / Input Power Boundary performance curves
+        boundary_c = self.boundary_c_curve(idb)
+        boundary_p = self.boundary_p_curve(idb)
+
+        # Heating Capacity Ratio / Input Power Ratio Modifier Functions of Low and High Temperatures
+        capft_l = self.capft_l(idb, owb)
+        capft_h = self.capft_h(idb, owb)
+        eirft_l = self.eirft_l(idb, owb)
+        eirft_h = self.eirft_h(idb, owb)
 
         # If the input outdoor wet-bulb temperature is lower than the calculated boundary owb
         # the low temperature region performance curve is used,
@@ -1502,6 +3199,16 @@ class VRFEPHeatingMode:
 
             return capacity, input_power, cop
 
+    # calと同じ計算を配列でまとめて行う（idb, owbは配列またはスカラー）
+    # 能力は境界boundary_c、入力はboundary_pを境に低温側・高温側の曲線を用いる
+    def cal_array(self, idb, owb):
+        idb, owb = np.broadcast_arrays(np.asarray(idb, dtype=float), np.asarray(owb, dtype=float))
+        capft = np.where(owb <= self.boundary_c_curve(idb), self.capft_l(idb, owb), self.capft_h(idb, owb))
+        eirft = np.where(owb <= self.boundary_p_curve(idb), self.eirft_l(idb, owb), self.eirft_h(idb, owb))
+        capacity = self.rated_capacity * capft
+        input_power = self.rated_input_power * (eirft * capft)
+        return capacity, input_power, capacity / input_power
+
 
 class GeoThermalHeatPump_LCEM:  # 松田氏作成（2022年）
     def __init__(self,
@@ -1537,6 +3244,8 @@ class GeoThermalHeatPump_LCEM:  # 松田氏作成（2022年）
         self.rated_freq = rated_freq
         self.coefficient_ele_a = coefficient_ele_a
         self.coefficient_ele_b = coefficient_ele_b
+        if not mod_temp_chs > 0:
+            raise ValueError('mod_temp_chs must be positive: {}'.format(mod_temp_chs))
         self.mod_temp_chs = mod_temp_chs
 
     def get_config(self):
@@ -1572,6 +3281,7 @@ class GeoThermalHeatPump_LCEM:  # 松田氏作成（2022年）
                    rated_flow_cd_h: float = None,  # L/min
                    rated_power_c: float = None,  # kW
                    rated_power_h: float = None,  # kW
+                   rated_freq: float = None,  # Hz
                    coefficient_ele_a: float = None,
                    coefficient_ele_b: float = None,
                    mod_temp_chs: float = None,
@@ -1607,8 +3317,79 @@ class GeoThermalHeatPump_LCEM:  # 松田氏作成（2022年）
         if not coefficient_ele_b is None:
             self.coefficient_ele_b = coefficient_ele_b
         if not mod_temp_chs is None:
+            if not mod_temp_chs > 0:
+                raise ValueError('mod_temp_chs must be positive: {}'.format(mod_temp_chs))
             self.mod_temp_chs = mod_temp_chs
 
+    # 全負荷時の能力upper_work_ch[kW]と消費電力full_power[kW]（mode, temp_chs, temp_cdsはスカラーまたは配列）
+    def _full_load(self, mode, temp_chs, temp_cds):
+        if self.rated_freq == 50.0:
+            upper_c = 0.02251 * temp_chs ** 2 + (-0.01407) * temp_chs * temp_cds + (
+                -0.00126) * temp_cds ** 2 + 1.738 * temp_chs + (-0.305) * temp_cds + 51.32
+            power_c = (-0.001418) * temp_chs ** 2 + 0.005793 * temp_chs * temp_cds + (
+                -0.0001034) * temp_cds ** 2 + (-0.1244) * temp_chs + 0.2912 * temp_cds + 3.218
+            upper_h = (-0.001352) * temp_chs ** 2 + (
+                -0.008325) * temp_chs * temp_cds + 0.02112 * temp_cds ** 2 + 0.03779 * temp_chs + 1.445 * temp_cds + 46.62
+            power_h = (-0.0001136) * temp_chs ** 2 + 0.005796 * temp_chs * temp_cds + (
+                -0.001418) * temp_cds ** 2 + 0.264 * temp_chs + (-0.1393) * temp_cds + 2.48
+        else:
+            upper_c = 0.02386 * temp_chs ** 2 + (-0.0165) * temp_chs * temp_cds + (
+                -0.001652) * temp_cds ** 2 + 1.997 * temp_chs + (-0.3499) * temp_cds + 60.22
+            power_c = (
+                          -0.0006445) * temp_chs ** 2 + 0.006063 * temp_chs * temp_cds + 0.0004485 * temp_cds ** 2 + (
+                          -0.1096) * temp_chs + 0.319 * temp_cds + 4.412
+            upper_h = (-0.001202) * temp_chs ** 2 + (
+                -0.01049) * temp_chs * temp_cds + 0.02322 * temp_cds ** 2 + 0.02972 * temp_chs + 1.709 * temp_cds + 55.42
+            power_h = 0.0004311 * temp_chs ** 2 + 0.006065 * temp_chs * temp_cds + (
+                -0.0006446) * temp_cds ** 2 + 0.28542 * temp_chs + (-0.1335) * temp_cds + 3.489
+        upper_c = upper_c / 53.0 * self.rated_cap_c
+        power_c = power_c / 10.8 * self.rated_power_c
+        upper_h = upper_h / 61.0 * self.rated_cap_h
+        power_h = power_h / 15.2 * self.rated_power_c
+        if np.ndim(mode) == 0:
+            return (upper_c, power_c) if mode == 1 else (upper_h, power_h)
+        return np.where(mode == 1, upper_c, upper_h), np.where(mode == 1, power_c, power_h)
+
+    # 部分負荷率に対する消費電力比（mode, mod_plrはスカラーまたは配列）
+    def _rate_power(self, mode, mod_plr):
+        if self.rated_freq == 50.0:
+            rate_c = 4.899 * mod_plr ** 4 + (-12.81) * mod_plr ** 3 + 12.05 * mod_plr ** 2 + (
+                -3.792) * mod_plr + 0.6557
+            rate_h = 1.804 * mod_plr ** 4 + (-4.428) * mod_plr ** 3 + 3.858 * mod_plr ** 2 + (
+                -0.4286) * mod_plr + 0.1962
+        else:
+            rate_c = (-1.304) * mod_plr ** 4 + 4.172 * mod_plr ** 3 + (
+                -4.376) * mod_plr ** 2 + 2.747 * mod_plr + (-0.2371)
+            rate_h = (-0.3699) * mod_plr ** 4 + 1.255 * mod_plr ** 3 + (
+                -1.309) * mod_plr ** 2 + 1.477 * mod_plr + (-0.04922)
+        if np.ndim(mode) == 0:
+            return rate_c if mode == 1 else rate_h
+        return np.where(mode == 1, rate_c, rate_h)
+
+    # 過負荷時の送水温度の探索。処理熱量が全負荷能力の1.05倍以下となる送水温度を、設定値temp_chsと還水温度temp_chrの間で
+    # 二分法により求める（許容誤差mod_temp_chs[℃]、処理できる側の値を返す）。還水温度でも処理できない場合はerror=1
+    # 反復はTEMP_CHS_MAXITER回まで（区間は2**-60倍になるので、通常は許容誤差で先に終わる）
+    TEMP_CHS_MAXITER = 60
+
+    def _solve_temp_chs(self, mode, temp_chs, flow_ch, temp_chr, temp_cds):
+        def residual(t):
+            upper_work_ch, full_power = self._full_load(mode, t, temp_cds)
+            return abs(t - temp_chr) * flow_ch * 60 / 860 - upper_work_ch * 1.05
+
+        a = temp_chs  # 処理できない側
+        b = float(temp_chr)  # 処理できる側
+        if residual(b) > 0:
+            return b, 1
+        for _ in range(self.TEMP_CHS_MAXITER):
+            if abs(b - a) <= self.mod_temp_chs:
+                break
+            m = (a + b) / 2
+            if residual(m) > 0:
+                a = m
+            else:
+                b = m
+        return b, 0
+
     def run(self,
             state: int,  # 0:stop, 1:run
             mode: int,  # 0:stop, 1:cooling, 2: heating
@@ -1633,60 +3414,17 @@ class GeoThermalHeatPump_LCEM:  # 松田氏作成（2022年）
             plr = 0.0
             mod_plr = 0.0
         else:
-            if mode == 1:
-                work_ch = self.rated_cap_c
-            else:
-                work_ch = self.rated_cap_h
-            upper_work_ch = 0.0
-
-            if mode == 1:
-                temp1 = self.temp_c * 2
-                temp2 = 0.0
-            else:
-                temp1 = self.temp_h * 2
-                temp2 = 0.0
-
-            while work_ch > upper_work_ch * 1.05:
-                self.upper_work_ch = upper_work_ch
-                self.temp_chs = tmp_temp_chs
-                self.work_ch = work_ch
-
+            work_ch = abs(tmp_temp_chs - temp_chr) * flow_ch * 60 / 860  # kW
+            upper_work_ch, full_power = self._full_load(mode, tmp_temp_chs, temp_cds)
+            # 過負荷の場合は送水温度を緩和する
+            if work_ch > upper_work_ch * 1.05:
+                tmp_temp_chs, error = self._solve_temp_chs(mode, tmp_temp_chs, flow_ch, temp_chr, temp_cds)
                 work_ch = abs(tmp_temp_chs - temp_chr) * flow_ch * 60 / 860  # kW
-                if mode == 1:
-                    if self.rated_freq == 50.0:
-                        upper_work_ch = 0.02251 * tmp_temp_chs ** 2 + (-0.01407) * tmp_temp_chs * temp_cds + (
-                            -0.00126) * temp_cds ** 2 + 1.738 * tmp_temp_chs + (-0.305) * temp_cds + 51.32
-                        full_power = (-0.001418) * tmp_temp_chs ** 2 + 0.005793 * tmp_temp_chs * temp_cds + (
-                            -0.0001034) * temp_cds ** 2 + (-0.1244) * tmp_temp_chs + 0.2912 * temp_cds + 3.218
-                    else:
-                        upper_work_ch = 0.02386 * tmp_temp_chs ** 2 + (-0.0165) * tmp_temp_chs * temp_cds + (
-                            -0.001652) * temp_cds ** 2 + 1.997 * tmp_temp_chs + (-0.3499) * temp_cds + 60.22
-                        full_power = (
-                                         -0.0006445) * tmp_temp_chs ** 2 + 0.006063 * tmp_temp_chs * temp_cds + 0.0004485 * temp_cds ** 2 + (
-                                         -0.1096) * tmp_temp_chs + 0.319 * temp_cds + 4.412
-                    upper_work_ch = upper_work_ch / 53.0 * self.rated_cap_c
-                    full_power = full_power / 10.8 * self.rated_power_c
-
-                else:
-                    if self.rated_freq == 50.0:
-                        upper_work_ch = (-0.001352) * tmp_temp_chs ** 2 + (
-                            -0.008325) * tmp_temp_chs * temp_cds + 0.02112 * temp_cds ** 2 + 0.03779 * tmp_temp_chs + 1.445 * temp_cds + 46.62
-                        full_power = (-0.0001136) * tmp_temp_chs ** 2 + 0.005796 * tmp_temp_chs * temp_cds + (
-                            -0.001418) * temp_cds ** 2 + 0.264 * tmp_temp_chs + (-0.1393) * temp_cds + 2.48
-                    else:
-                        upper_work_ch = (-0.001202) * tmp_temp_chs ** 2 + (
-                            -0.01049) * tmp_temp_chs * temp_cds + 0.02322 * temp_cds ** 2 + 0.02972 * tmp_temp_chs + 1.709 * temp_cds + 55.42
-                        full_power = 0.0004311 * tmp_temp_chs ** 2 + 0.006065 * tmp_temp_chs * temp_cds + (
-                            -0.0006446) * temp_cds ** 2 + 0.28542 * tmp_temp_chs + (-0.1335) * temp_cds + 3.489
-                    upper_work_ch = upper_work_ch / 61.0 * self.rated_cap_h
-                    full_power = full_power / 15.2 * self.rated_power_c
-                full_cop = upper_work_ch / full_power
-
-                if work_ch > upper_work_ch * 1.05:
-                    if mode == 1:
-                        tmp_temp_chs += self.mod_temp_chs
-                    else:
-                        tmp_temp_chs -= self.mod_temp_chs
+                upper_work_ch, full_power = self._full_load(mode, tmp_temp_chs, temp_cds)
+            full_cop = upper_work_ch / full_power
+            self.upper_work_ch = upper_work_ch
+            self.temp_chs = tmp_temp_chs
+            self.work_ch = work_ch
 
             plr = work_ch / upper_work_ch
             mod_plr = max(0.3, plr)
@@ -1704,20 +3442,7 @@ class GeoThermalHeatPump_LCEM:  # 松田氏作成（2022年）
                 work_h = work_ch
 
         else:
-            if mode == 1:
-                if self.rated_freq == 50.0:
-                    rate_power = 4.899 * mod_plr ** 4 + (-12.81) * mod_plr ** 3 + 12.05 * mod_plr ** 2 + (
-                        -3.792) * mod_plr + 0.6557
-                else:
-                    rate_power = (-1.304) * mod_plr ** 4 + 4.172 * mod_plr ** 3 + (
-                        -4.376) * mod_plr ** 2 + 2.747 * mod_plr + (-0.2371)
-            else:
-                if self.rated_freq == 50.0:
-                    rate_power = 1.804 * mod_plr ** 4 + (-4.428) * mod_plr ** 3 + 3.858 * mod_plr ** 2 + (
-                        -0.4286) * mod_plr + 0.1962
-                else:
-                    rate_power = (-0.3699) * mod_plr ** 4 + 1.255 * mod_plr ** 3 + (
-                        -1.309) * mod_plr ** 2 + 1.477 * mod_plr + (-0.04922)
+            rate_power = self._rate_power(mode, mod_plr)
             if work_ch == 0.0:
                 power = 0.0
                 cop = 0.0
@@ -1738,8 +3463,6 @@ class GeoThermalHeatPump_LCEM:  # 松田氏作成（2022年）
                 work_c = 0.0
                 work_h = work_ch
 
-        # print(upper_work_ch, work_ch, temp_cdr, temp_cds, tmp_temp_chs)
-        # print(upper_work_ch, work_ch, plr)
         # result
         res = {"temp_chs": tmp_temp_chs,
                "temp_cdr": temp_cdr,
@@ -1754,18 +3477,232 @@ class GeoThermalHeatPump_LCEM:  # 松田氏作成（2022年）
                }
         return res
 
+    # runと同じ計算を時系列の配列でまとめて行う（機器の状態は更新しない）
+    # 引数はrunと同じ（配列またはスカラー）。戻り値はrunと同じキーの配列の辞書
+    def run_array(self, state, mode, flow_ch, temp_chr, flow_cd, temp_cds):
+        state, mode, flow_ch, temp_chr, flow_cd, temp_cds = np.broadcast_arrays(
+            *[np.asarray(v, dtype=float) for v in (state, mode, flow_ch, temp_chr, flow_cd, temp_cds)])
+        run = state * mode != 0
+        temp_chs = np.where(mode == 2, float(self.temp_h), float(self.temp_c))
+        error = np.zeros(temp_chs.shape, dtype=int)
+
+        def residual(t):
+            upper, full = self._full_load(mode, t, temp_cds)
+            return abs(t - temp_chr) * flow_ch * 60 / 860 - upper * 1.05
+
+        # 過負荷の場合は送水温度を緩和する（_solve_temp_chsと同じ二分法）
+        over = run & (residual(temp_chs) > 0)
+        if np.any(over):
+            b = np.where(over, temp_chr, temp_chs)  # 処理できる側
+            failed = over & (residual(b) > 0)
+            error[failed] = 1
+            a = np.where(over & ~failed, temp_chs, b)  # 処理できない側
+            active = np.abs(b - a) > self.mod_temp_chs
+            for _ in range(self.TEMP_CHS_MAXITER):
+                if not np.any(active):
+                    break
+                m = (a + b) / 2
+                m_over = residual(m) > 0
+                a = np.where(active & m_over, m, a)
+                b = np.where(active & ~m_over, m, b)
+                active = np.abs(b - a) > self.mod_temp_chs
+            temp_chs = b
+
+        work_ch = np.where(run, np.abs(temp_chs - temp_chr) * flow_ch * 60 / 860, 0.0)
+        upper_work_ch, full_power = self._full_load(mode, temp_chs, temp_cds)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mod_plr = np.where(run, np.maximum(0.3, work_ch / upper_work_ch), 0.0)
+            rate_power = self._rate_power(mode, mod_plr)
+            power = np.where(run & (work_ch != 0.0),
+                             np.maximum(0, self.coefficient_ele_a * full_power * rate_power + self.coefficient_ele_b),
+                             0.0)
+            cop = np.where(run & (work_ch != 0.0), work_ch / power, 0.0)
+            heat = np.where(mode == 1, work_ch + power, -work_ch + power)
+            temp_cdr = np.where(run & (flow_ch != 0), temp_cds + heat * 860 / 60 / flow_cd, temp_cds)
+
+        return {"temp_chs": temp_chs,
+                "temp_cdr": temp_cdr,
+                "flow_cd": flow_cd,
+                "cooling": np.where(mode == 1, work_ch, 0.0),
+                "heating": np.where(mode == 1, 0.0, work_ch),
+                "PLR": mod_plr,
+                "COP": cop,
+                "power": power,
+                "gas": np.zeros(temp_chs.shape),
+                "error": error,
+                }
+
+
+# 地中熱交換器（ボアホール群）
+# 有限線熱源（FLS）のg-functionにより、採放熱量の履歴からボアホール壁温度・熱源水温度を求める。
+# GeoThermalHeatPump_LCEMの熱源水（冷却水）側に接続して用いる。例：
+#   res = hp.run(1, 1, flow_ch, temp_chr, flow_cd, ghe.tout)
+#   ghe.cal(res['temp_cdr'], flow_cd)
+# calは1ステップずつの計算で、Claesson-Javedの多段階負荷集約により履歴の計算量を一定に保つ。
+# cal_seriesは熱量の時系列を一括でFFTにより畳み込む（O(n log n)）。
+# Claesson, J., Javed, S. (2011) An analytical method to calculate borehole fluid temperatures for time-scales from
+# minutes to decades, ASHRAE Transactions 117(2)
+# Claesson, J., Javed, S. (2012) A load-aggregation method to calculate extraction temperatures of borehole heat
+# exchangers, ASHRAE Transactions 118(1)
+class GroundHeatExchanger:
+    def __init__(self, h=100.0, d=4.0, r_b=0.075, k_s=2.0, alpha=1.0e-6, t_g=15.0, r_th=0.1, positions=None,
+                 dt=3600.0, years=50, n_cell=5, n_grid=60):
+        # h         :ボアホール長さ[m]
+        # d         :ボアホール上端の深さ[m]
+        # r_b       :ボアホール半径[m]
+        # k_s       :土壌の熱伝導率[W/(m・K)]
+        # alpha     :土壌の温度伝導率[m2/s]
+        # t_g       :不易層温度['C]
+        # r_th      :ボアホール熱抵抗[m・K/W]
+        # positions :ボアホールの位置[(x, y), ...][m]（Noneの場合は1本）
+        # dt        :計算時間間隔[s]
+        # years     :計算期間の上限[年]（g-functionと負荷集約の範囲）
+        # n_cell    :負荷集約の1段あたりのセル数
+        # n_grid    :g-functionを求める時刻の数（対数等間隔、間は補間する）
+        # flow      :熱源水流量[L/min]
+        # tin       :熱源水入口温度（ヒートポンプからの還り）['C]
+        # tout      :熱源水出口温度（ヒートポンプへの送り）['C]
+        # q         :地中への放熱量[kW]（採熱は負）
+        # t_b       :ボアホール壁温度['C]
+        # t_f       :熱源水平均温度['C]
+        self.h = h
+        self.d = d
+        self.r_b = r_b
+        self.k_s = k_s
+        self.alpha = alpha
+        self.t_g = t_g
+        self.r_th = r_th
+        self.positions = [(0.0, 0.0)] if positions is None else [(float(x), float(y)) for x, y in positions]
+        self.n = len(self.positions)
+        self.dt = dt
+
+        # g-function（ボアホール群の平均、各ボアホールの熱量は等しいと仮定）を対数等間隔の時刻で求める
+        t_max = years * 365 * 24 * 3600
+        self.t_grid = np.geomspace(min(dt, 60.0), t_max, n_grid)
+        dist = {}
+        for x1, y1 in self.positions:
+            for x2, y2 in self.positions:
+                r = math.hypot(x1 - x2, y1 - y2)
+                r = self.r_b if r < self.r_b else round(r, 6)
+                dist[r] = dist.get(r, 0) + 1
+        self.g_grid = np.array([sum(c * self._fls(t, r) for r, c in dist.items()) / self.n for t in self.t_grid])
+
+        # 負荷集約のセル（1段目はdt幅のセルがn_cell個、以降は段ごとに幅が2倍）
+        n_step = t_max / dt
+        n_level = max(1, math.ceil(math.log2(n_step / n_cell + 1)))
+        self.cell_width = np.repeat(2.0 ** np.arange(n_level), n_cell)
+        self.g_cell = self.g(np.cumsum(self.cell_width) * dt)
+        self.q_cell = np.zeros(len(self.cell_width))
+
+        self.flow = 0.0
+        self.q = 0.0
+        self.tin = t_g
+        self.tout = t_g
+        self.t_b = t_g
+        self.t_f = t_g
+
+    # 有限線熱源の無次元温度応答（距離r[m]、時刻t[s]）
+    def _fls(self, t, r):
+        h = self.h
+        d = self.d
+
+        def ierf(x):
+            return x * special.erf(x) - (1 - math.exp(-x * x)) / math.sqrt(math.pi)
+
+        def f(s):
+            y = 2 * ierf(h * s) + 2 * ierf((h + 2 * d) * s) - ierf((2 * h + 2 * d) * s) - ierf(2 * d * s)
+            return math.exp(-r * r * s * s) / (s * s) * y
+
+        return 0.5 / h * integrate.quad(f, 1 / math.sqrt(4 * self.alpha * t), np.inf, limit=200)[0]
+
+    # g-function（時刻t[s]はスカラーまたは配列、ln(t)で線形補間）
+    def g(self, t):
+        return np.interp(np.log(t), np.log(self.t_grid), self.g_grid)
+
+    # 熱抵抗（熱量1kWあたりの温度上昇[K/kW]）
+    def _k(self, g):
+        return g / (2 * math.pi * self.k_s) * 1000 / (self.h * self.n)
+
+    # 1ステップ分の計算（dt経過）
+    # tin  :熱源水入口温度['C]（GeoThermalHeatPump_LCEM.runのtemp_cdr）
+    # flow :熱源水流量[L/min]（GeoThermalHeatPump_LCEM.runのflow_cd）
+    # 戻り値:熱源水出口温度['C]（次のステップのGeoThermalHeatPump_LCEM.runのtemp_cds）
+    def cal(self, tin, flow):
+        self.tin = tin
+        self.flow = flow
+        # 各セルの熱量を1ステップ分古い側へ移す
+        self.q_cell[1:] += (self.q_cell[:-1] - self.q_cell[1:]) / self.cell_width[1:]
+        # 今回の熱量以外による壁温度変化
+        t_hist = self.t_g + self._k(np.dot(self.q_cell[1:], self.g_cell[1:] - self.g_cell[:-1]))
+        r_b = self._k(self.g_cell[0]) + self.r_th * 1000 / (self.h * self.n)  # [K/kW]
+        if flow > 0:
+            mc = flow * 60 / 860  # [kW/K]
+            self.q = (tin - t_hist) / (1 / (2 * mc) + r_b)
+            self.tout = tin - self.q / mc
+        else:
+            self.q = 0.0
+        self.q_cell[0] = self.q
+        self.t_b = t_hist + self._k(self.g_cell[0]) * self.q
+        self.t_f = self.t_b + self.r_th * 1000 / (self.h * self.n) * self.q
+        if flow <= 0:
+            self.tout = self.t_f
+        return self.tout
+
+    # 熱量を与えて1ステップ分計算する（戻り値はボアホール壁温度['C]）
+    def cal_q(self, q):
+        self.q_cell[1:] += (self.q_cell[:-1] - self.q_cell[1:]) / self.cell_width[1:]
+        self.q_cell[0] = q
+        self.q = q
+        self.t_b = self.t_g + self._k(np.dot(self.q_cell, self.g_cell - np.append(0.0, self.g_cell[:-1])))
+        self.t_f = self.t_b + self.r_th * 1000 / (self.h * self.n) * q
+        return self.t_b
+
+    # 熱量の履歴を消去する
+    def reset(self):
+        self.q_cell[:] = 0.0
+        self.q = 0.0
+        self.tin = self.tout = self.t_b = self.t_f = self.t_g
+
+    # 地中への放熱量q[kW]の時系列（dt間隔）から温度の時系列を一括で計算する（FFTによる畳み込み、機器の状態は更新しない）
+    # flow :熱源水流量[L/min]（スカラーまたは配列）。指定した場合は入口・出口温度も求める
+    # 戻り値:t_b, t_f（, tin, tout）の配列の辞書
+    def cal_series(self, q, flow=None):
+        q = np.asarray(q, dtype=float)
+        n = len(q)
+        g = self.g(np.arange(1, n + 1) * self.dt)
+        dq = np.diff(q, prepend=0.0)
+        size = 1 << (2 * n - 1).bit_length()
+        conv = np.fft.irfft(np.fft.rfft(dq, size) * np.fft.rfft(g, size), size)[:n]
+        res = {'t_b': self.t_g + self._k(conv)}
+        res['t_f'] = res['t_b'] + self.r_th * 1000 / (self.h * self.n) * q
+        if flow is not None:
+            flow = np.broadcast_to(np.asarray(flow, dtype=float), q.shape)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                half = np.where(flow > 0, q / (2 * flow * 60 / 860), 0.0)
+            res['tin'] = res['t_f'] + half
+            res['tout'] = res['t_f'] - half
+        return res
+
 
 # 冷却塔
 class CoolingTower:
-    def __init__(self, tin_w_d=37.0, tout_w_d=32.0, twb_d=27.0, g_w_d=0.26, g_a_d=123.0, pw_d=2.4, actual_head=2.0, kr=1.0):
-        # ua        :UA値(熱交換面積[m2]×熱伝達係数[W/(m2'C)]
+    # UA値の校正値のキャッシュのキーに含める。calの計算方法（出口湿球温度の収束計算等）を変更した場合は更新する
+    CALIBRATION_VERSION = 2
+
+    def __init__(self, tin_w_d=37.0, tout_w_d=32.0, twb_d=27.0, g_w_d=0.26, g_a_d=123.0, pw_d=2.4, actual_head=2.0, kr=1.0,
+                 ua=None):
+        # ua        :UA値(熱交換面積[m2]×熱伝達係数[W/(m2'C)] Noneの場合は定格値から求める（同じ定格値では再計算しない）
         # g_w       :冷却水流量[kg/s]
         # g_a       :風量[kg/s]
         # tin_w     :冷却水入口温度[℃]
         # tdb       :(外気)乾球温度[℃]
         # rh        :(外気)相対湿度(0~100)
+        # hin       :(外気)比エンタルピー[kJ/kg'] 計算済みの場合に指定（read_weather参照）
+        # twbin     :(外気)湿球温度[℃] 計算済みの場合に指定（read_weather参照）
         # inv       :ファンインバーター周波数比（0.0~1.0）
         # flag      :収束計算確認のフラグ
+        # twbout    :空気出口湿球温度[℃] 次の時刻の収束計算の初期値に用いる
+        # n_iter    :収束計算の反復回数（n_iter_totalは累計）
         # actual head: 実揚程 [m]
         # g_a_d     :定格風量 [m3/min]
         # pw_d      :定格消費電力 [kW]
@@ -1781,6 +3718,9 @@ class CoolingTower:
         self.pw = 0
         self.dp = 0
         self.tout_w = 15
+        self.twbout = None
+        self.n_iter = 0
+        self.n_iter_total = 0
         self.actual_head = actual_head
         self.g_a_d = g_a_d
         self.pw_d = pw_d
@@ -1789,34 +3729,45 @@ class CoolingTower:
         self.twb_d = twb_d
         self.g_w_d = g_w_d
 
-        # UA値の探索
-        ua_min = 0.1
-        ua_max = 9999999999
-        tout_w0 = self.tout_w_d + 1
-        cnt = 0
-        while abs(tout_w0 - self.tout_w_d) > 0.001:
-            self.ua = (ua_min + ua_max)/2
-            tout_w0 = self.cal(self.g_w_d, self.tin_w_d, self.twb_d, 100)
-            if tout_w0 - self.tout_w_d > 0:
-                ua_min = self.ua
-            else:
-                ua_max = self.ua
-            cnt += 1
-            if cnt == 100:
-                print("The ua value for cooling tower is not calibrated appropriately")
-                break
+        # UA値の探索（校正済みの値があればそれを用いる）
+        design = (self.CALIBRATION_VERSION, tin_w_d, tout_w_d, twb_d, g_w_d, g_a_d, PSAT_BACKEND)
+        if ua is None:
+            ua = _calibration_get('CoolingTower', design)
+        if ua is not None:
+            self.ua = ua
+            self.cal(self.g_w_d, self.tin_w_d, self.twb_d, 100)
+        else:
+            ua_min = 0.1
+            ua_max = 9999999999
+            tout_w0 = self.tout_w_d + 1
+            cnt = 0
+            while abs(tout_w0 - self.tout_w_d) > 0.001:
+                self.ua = (ua_min + ua_max)/2
+                tout_w0 = self.cal(self.g_w_d, self.tin_w_d, self.twb_d, 100)
+                if tout_w0 - self.tout_w_d > 0:
+                    ua_min = self.ua
+                else:
+                    ua_max = self.ua
+                cnt += 1
+                if cnt == 100:
+                    print("The ua value for cooling tower is not calibrated appropriately")
+                    break
+            if cnt < 100:
+                _calibration_put('CoolingTower', design, self.ua)
 
         self.inv = 0.0  # 初期値0とする
 
-    def cal(self, g_w, tin_w, tdb, rh):
+    def cal(self, g_w, tin_w, tdb, rh, hin=None, twbin=None, tol=0.01):
         # cpw       :冷却水の比熱 [J/kg'C]
         # cp        :湿り空気（外気）の比熱 [J/kg'C]
+        # tol       :空気出口湿球温度の収束判定値 ['C]
         self.g_w = g_w
         self.tdb = tdb
         self.rh = rh
         self.tin_w = tin_w
         self.g_a = self.inv * self.g_a_d  # [m3/min]
         self.pw = self.pw_d * self.inv ** 3  # [kW]3乗則の仮定に基づく計算。
+        self.n_iter = 0
 
         if self.g_a < 10:  # natural wind
             self.g_a = 10
@@ -1829,28 +3780,18 @@ class CoolingTower:
 
         if g_w > 0:
 
-            # 乾球温度と湿球温度から外気比エンタルピーを求める
-            [hin, xin] = tdb_rh2h_x(tdb, rh)
-            twbin = tdb_rh2twb(tdb, rh)
+            # 乾球温度と湿球温度から外気比エンタルピーを求める（計算済みの値が与えられた場合はそれを用いる）
+            if hin is None:
+                [hin, xin] = tdb_rh2h_x(tdb, rh)
+            if twbin is None:
+                twbin = tdb_rh2twb(tdb, rh)
 
-            # 湿球温度の飽和空気の比エンタルピーを求める
-            # print(Twin,Twbin)
             # 空気出口湿球温度の最大値・最小値
             twboutmax = max(self.tin_w, twbin)
             twboutmin = min(self.tin_w, twbin)
 
-            # 収束計算に入るための適当な初期値設定
-            twbout0 = 1
-            twbout = 0
-            cnt = 0
-            q = 0.0
-            cw = 0.0
-            self.flag = 0
-
-            while (twbout0 - twbout < - 0.01) or (twbout0 - twbout > 0.01):
-
-                # 空気出口湿球温度の仮定
-                twbout0 = (twboutmax + twboutmin) / 2
+            # 空気出口湿球温度を仮定したときの出口湿球温度の計算値
+            def f(twbout0):
                 # 出口空気は飽和空気という仮定で、出口空気の比エンタルピーを求める。
                 [hout, xout] = tdb_rh2h_x(twbout0, 100)
 
@@ -1876,18 +3817,56 @@ class CoolingTower:
 
                 q = eps * cmin * (self.tin_w - twbin)
 
-                twbout = twbin + q / ca
-                # print(Q,Twbout)
-                if twbout < twbout0:
-                    twboutmax = twbout0
-                else:
-                    twboutmin = twbout0
+                return twbin + q / ca, q, cw
 
-                cnt += 1
-                if cnt > 30:
+            # 初期値は前の時刻の空気出口湿球温度（範囲外の場合は中間値）
+            if self.twbout is not None and twboutmin < self.twbout < twboutmax:
+                twbout0 = self.twbout
+            else:
+                twbout0 = (twboutmax + twboutmin) / 2
+            self.flag = 0
+            # セカント法（挟み込みができた後はイリノイ法）で 仮定値 = 計算値 となる空気出口湿球温度を求める
+            # r > 0 の点が下限側、r < 0 の点が上限側
+            x_lo = r_lo = x_hi = r_hi = x_prev = r_prev = None
+            side = 0
+            while True:
+                twbout, q, cw = f(twbout0)
+                self.n_iter += 1
+                r = twbout - twbout0
+                if abs(r) <= tol:
+                    break
+                if self.n_iter >= 30:
                     self.flag = 1
                     break
 
+                if r > 0:
+                    twboutmin = twbout0
+                    x_lo, r_lo = twbout0, r
+                    if side == 1 and r_hi is not None:
+                        r_hi /= 2
+                    side = 1
+                else:
+                    twboutmax = twbout0
+                    x_hi, r_hi = twbout0, r
+                    if side == -1 and r_lo is not None:
+                        r_lo /= 2
+                    side = -1
+
+                if x_lo is not None and x_hi is not None:
+                    x_new = x_hi - r_hi * (x_hi - x_lo) / (r_hi - r_lo)
+                elif x_prev is not None and r != r_prev:
+                    x_new = twbout0 - r * (twbout0 - x_prev) / (r - r_prev)
+                else:
+                    x_new = twbout
+                if not twboutmin < x_new < twboutmax:
+                    x_new = (twboutmax + twboutmin) / 2
+
+                x_prev, r_prev = twbout0, r
+                twbout0 = x_new
+
+            self.twbout = twbout0
+            self.n_iter_total += self.n_iter
+
             self.tout_w = self.tin_w - q / cw
 
         self.dp = -self.kr * self.g_w ** 2
@@ -2354,8 +4333,12 @@ class HeatExchangerW2A:
     # HVACSIM+
     # 宇田川光弘：パソコンによる空気調和計算法，オーム社，p.8-219，1986 年.
     # 富樫 英介 : Popolo.2.2.0_熱環境計算戯法, 第8-9章, 2016 年.
+    # 伝熱面積の校正値のキャッシュのキーに含める。定格条件からの求め方を変更した場合は更新する
+    CALIBRATION_VERSION = 2
+
     def __init__(self, rated_g_air=2.5, rated_v_air=2.99, rated_tdbin_air=27.2, rated_twbin_air=20.1,
-                 rated_g_water=1.9833333, rated_v_water=1.25, rated_tin_water=7, rated_q=40.4, rated_rh_border=95):
+                 rated_g_water=1.9833333, rated_v_water=1.25, rated_tin_water=7, rated_q=40.4, rated_rh_border=95,
+                 area_surface=None):
         # q_load    :負荷熱量[GJ/min]
         # _d        :定格
         # q         :熱交換能力[kW]
@@ -2367,6 +4350,8 @@ class HeatExchangerW2A:
         # ntu       :移動単位数(熱容量流量に対する熱交換器の能力)[-]
         # eff       :熱通過有効度[-]
         # rh_border :境界湿度[%]
+        # area_surface :伝熱面積[m2] Noneの場合は定格値から求める（同じ定格値では再計算しない）
+        #               指定した場合は定格条件での中間値（rated_cap_min, rated_lmtd等）は求めない
         self.rated_v_water = rated_v_water
         self.rated_v_air = rated_v_air
         self.rated_g_air = rated_g_air
@@ -2409,13 +4394,30 @@ class HeatExchangerW2A:
         self.rated_cap_air = self.rated_g_air * self.rated_cpma
         self.rated_cap_water = self.rated_g_water * 4.186
 
+        if area_surface is not None:
+            self.area_surface = area_surface
+        else:
+            # 伝熱面積と定格条件での中間値（rated_*）をまとめて保存・復元するので、キャッシュの有無によらず同じ状態になる
+            design = (self.CALIBRATION_VERSION, rated_g_air, rated_v_air, rated_tdbin_air, rated_twbin_air,
+                      rated_g_water, rated_v_water, rated_tin_water, rated_q, rated_rh_border, PSAT_BACKEND)
+            rated = _calibration_get('HeatExchangerW2A', design)
+            if rated is None:
+                before = set(vars(self))
+                self._rated_area_surface()
+                rated = {name: value for name, value in vars(self).items() if name not in before}
+                rated = _calibration_put('HeatExchangerW2A', design, rated)
+            for name, value in rated.items():
+                setattr(self, name, value)
+
+    # 定格条件から伝熱面積[m2]を求める
+    def _rated_area_surface(self):
         if self.rated_tdbin_air < self.rated_tin_water:
             # heating coil
             self.rated_cap_min = min(self.rated_cap_air, self.rated_cap_water)
             self.rated_cap_max = max(self.rated_cap_air, self.rated_cap_water)
 
             self.rated_eff = self.rated_q / self.rated_cap_min / (self.rated_tin_water - self.rated_tdbin_air)
-            self.rated_ntu = hex_ntu(self.rated_eff, self.rated_cap_min, self.rated_cap_max, 'counterflow')
+            self.rated_ntu = hex_ntu(self.rated_eff, self.rated_cap_min / self.rated_cap_max, 'counterflow')
             self.area_surface = self.rated_ntu * self.rated_cap_min / self.rated_coef_dry
         else:
             # cooling coil
@@ -2461,6 +4463,7 @@ class HeatExchangerW2A:
                 self.rated_area_wet_sur = self.rated_h_border_wet / self.rated_lmhd / self.rated_coef_wet
 
                 self.area_surface = self.rated_area_dry_sur + self.rated_area_wet_sur
+        return self.area_surface
 
     def cal(self, tdb_in_air, w_in_air, tin_water, g_air, g_water):
         # simulation input
@@ -2650,7 +4653,8 @@ class Damper:
 # ファン特性と消費電力計算
 class Fan:
     # 定格値の入力
-    def __init__(self, pg=[948.66, -0.5041, -0.097, 0], eg=[0.0773, 0.0142, -1.00e-04], r_ef=0.6, g_d=80, inv=1.0, figure=1):
+    def __init__(self, pg=[948.66, -0.5041, -0.097, 0], eg=[0.0773, 0.0142, -1.00e-04], r_ef=0.6, g_d=80, inv=1.0,
+                 figure=0, name=None):
         # pg    :圧力-流量(pg)曲線の係数（切片、一次、二次、三次）
         # eg    :効率-流量(eg)曲線の係数（切片、一次、二次）
         # r_ef  :定格時の最高効率(本来は計算によって求める？)rated efficiency
@@ -2661,10 +4665,12 @@ class Fan:
         # flag  :計算に問題があったら1、なかったら0
         # ef    :効率(0.0~1.0)
         # g_d   :定格風量[m3/min]
-        # figure :1だったらポンプの性能曲線を表示する、1でなかったら表示しない
+        # figure :1だったらファンの性能曲線を表示する、1でなかったら表示しない（性能曲線の保存はsave_curve_figures参照）
+        # name  :機器名（グラフのタイトル等に用いる）
 
-        (filename, line_number, function_name, text) = traceback.extract_stack()[-2]
-        self.name = text[:text.find('=')].strip()  # インスタンス名の取得、'__init__'の最初でなければならない
+        self.name = name
+        if name is None and figure == 1:
+            self.name = _instance_name()  # 従来どおり、figure=1の場合はインスタンス名を機器名とする
 
         self.pg = pg
         self.eg = eg
@@ -2743,33 +4749,23 @@ class Fan:
             self.pw = 0.0
             self.flag = 0
 
+    # 風量g、回転数比invの配列に対する静圧・効率・消費電力・flag（fan_power参照）
+    def cal_array(self, g, inv):
+        return fan_power(g, inv, self.pg, self.eg, self.r_ef)
+
     def figure_curve(self):
-        x_max, _ = quadratic_formula(self.pg[0], self.pg[1], self.pg[2])
-        x = np.linspace(0, self.g_d, 50)
-        y_p = (self.pg[0] + self.pg[1] * (x/self.inv) + self.pg[2] * (x/self.inv) ** 2) * self.inv ** 2
-        x2_max, _ = quadratic_formula(self.pg[0] * self.inv ** 2, self.pg[1] * self.inv, self.pg[2])
-        # x2 = np.linspace(0, min(self.g_d, x2_max), 50)
-        x2 = np.linspace(0, self.g_d * self.inv, 50)
-        k = (1.0 - (1.0 - self.r_ef) / (self.inv ** 0.2)) / self.r_ef
-        y_e = k * (self.eg[0] + self.eg[1] * (x2/self.inv) + self.eg[2] * (x2/self.inv) ** 2)
+        import matplotlib.pyplot as plt
         fig, ax1 = plt.subplots()
-        color1 = 'tab:orange'
-        ax1.set_xlabel('Flow [m3/min]')
-        ax1.set_ylabel('Pressure [Pa]', color=color1)
-        ax1.plot(x, y_p, color=color1)
-        ax1.tick_params(axis='y', labelcolor=color1)
-        ax1.set_ylim(0, self.pg[0] + 10)
-
-        ax2 = ax1.twinx()
-        color2 = 'tab:blue'
-        ax2.set_ylabel('Efficiency [-]', color=color2)
-        ax2.plot(x2, y_e, color=color2)
-        ax2.tick_params(axis='y', labelcolor=color2)
-        ax2.set_ylim(0, 1)
-        plt.title('{}'.format(self.name))
-
+        self.plot_curve(ax1)
         return plt.show()
 
+    # 性能曲線（静圧・効率）をaxに描く
+    def plot_curve(self, ax):
+        x = np.linspace(0, self.g_d, 50)
+        y_p = (self.pg[0] + self.pg[1] * (x/self.inv) + self.pg[2] * (x/self.inv) ** 2 +
+               self.pg[3] * (x/self.inv) ** 3) * self.inv ** 2
+        _plot_curve(ax, self, x, y_p, 'Pressure [Pa]')
+
 
 # 蒸気噴霧式加湿器
 class SteamSprayHumidifier: